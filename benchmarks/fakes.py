@@ -0,0 +1,276 @@
+"""Offline stand-ins for yt-dlp and discord.py objects used by the benchmarks."""
+
+import os
+import time
+import zlib
+import asyncio
+import threading
+import types
+
+import discord
+import yt_dlp
+
+from modules.audio.urls import video_id
+
+
+def fake_video_id(i):
+    return f"vid{i:08d}"
+
+
+def video_url(i):
+    return f"https://www.youtube.com/watch?v={fake_video_id(i)}"
+
+
+class FakeYoutubeDL:
+    """Answers extract_info from synthetic data instead of YouTube.
+
+    URLs with ``list=`` in them are playlists of ``playlist_size`` flat
+    entries, yielded lazily like yt-dlp does with ``process=False``;
+    ``ytsearch:`` queries find one video derived from the query, and
+    anything else is a single video. Downloads write ``file_size`` bytes
+    of raw "audio" where yt-dlp would have.
+    """
+
+    playlist_size = 1000
+    # Seconds every extraction takes, plus download_latency when downloading
+    latency = 0.0
+    download_latency = 0.0
+    file_size = 64 * 1024
+
+    def __init__(self, params=None):
+        self.params = params or {}
+        self.progress_hooks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def add_post_processor(self, pp, when="post_process"):
+        pass
+
+    def add_progress_hook(self, hook):
+        self.progress_hooks.append(hook)
+
+    # Post-processors report through their downloader when created
+    def report_warning(self, message, *args, **kwargs):
+        pass
+
+    def write_debug(self, message, *args, **kwargs):
+        pass
+
+    def to_screen(self, message, *args, **kwargs):
+        pass
+
+    def extract_info(self, url, download=True, process=True):
+        if self.latency:
+            time.sleep(self.latency)
+        if url.startswith("ytsearch:"):
+            vid = fake_video_id(zlib.crc32(url.encode()) % 10**8)
+            return {"_type": "playlist", "entries": [self.video(vid)]}
+        if "list=" in url:
+            entries = (
+                {"_type": "url", "id": fake_video_id(i), "duration": 180 + i % 120}
+                for i in range(self.playlist_size)
+            )
+            return {
+                "_type": "playlist",
+                "webpage_url": url,
+                "entries": entries if not process else list(entries),
+            }
+        info = self.video(video_id(url) or fake_video_id(0))
+        if download:
+            # Downloads report progress every 100 ms, like chunks arriving
+            remaining = self.download_latency
+            while remaining > 0:
+                time.sleep(min(remaining, 0.1))
+                remaining -= 0.1
+                for hook in self.progress_hooks:
+                    hook({"status": "downloading", "info_dict": info})
+            with open(self.prepare_filename(info), "wb") as f:
+                f.write(b"\0" * self.file_size)
+        return info
+
+    @staticmethod
+    def video(vid):
+        return {
+            "id": vid,
+            "title": f"Video {vid}",
+            "webpage_url": f"https://www.youtube.com/watch?v={vid}",
+            "url": f"https://example.invalid/{vid}.webm",
+            "ext": "webm",
+            "acodec": "opus",
+            "duration": 200,
+            "extractor_key": "Youtube",
+        }
+
+    def prepare_filename(self, info):
+        outtmpl = self.params.get("outtmpl")
+        if outtmpl is None:
+            return f"{info['id']}.{info['ext']}"
+        return outtmpl % info
+
+
+def fake_transcode(source, target, codec, gain=0.0, keep_source=False):
+    # Stands in for modules.audio.transcode.transcode without FFmpeg
+    os.replace(source, target)
+    return target
+
+
+def fake_analyze(filepath, scheduler=None):
+    # Stands in for modules.audio.loudness.analyze without FFmpeg; every
+    # track measures on target, so none needs a gain applied
+    return -14.0, 0.0
+
+
+def install_fake_youtube_dl():
+    yt_dlp.YoutubeDL = FakeYoutubeDL
+
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+        self.voice_client = None
+
+    def get_member(self, user_id):
+        return None
+
+
+def fake_bot():
+    return types.SimpleNamespace(
+        loop=asyncio.get_running_loop(),
+        voice_clients=[],
+        get_cog=lambda name: None,
+    )
+
+
+class FakeAudio(discord.AudioSource):
+    """Produces ``track_seconds`` worth of 20 ms frames without FFmpeg.
+
+    Accepts the arguments of FFmpegOpusAudio/FFmpegPCMAudio so it can be
+    swapped in for either; with ``data`` it also carries the song metadata
+    the cog reads off its sources.
+    """
+
+    track_seconds = 30
+    # A 128 kbit/s Opus packet, or one frame of 16-bit stereo 48 kHz PCM
+    OPUS_FRAME = b"\0" * 320
+    PCM_FRAME = b"\0" * 3840
+
+    def __init__(self, source, *, data=None, codec=None, **kwargs):
+        self.source = source
+        self.opus = codec is not None
+        self.frames_left = int(self.track_seconds * 50)
+        data = data or {}
+        self.data = data
+        self.title = data.get("title")
+        self.url = data.get("url")
+        self.duration = data.get("duration")
+        self.thumbnail = data.get("thumbnail")
+
+    def is_opus(self):
+        return self.opus
+
+    def read(self):
+        if self.frames_left <= 0:
+            return b""
+        self.frames_left -= 1
+        return self.OPUS_FRAME if self.opus else self.PCM_FRAME
+
+
+class FakeVoiceClient:
+    """Plays a source on its own thread, one frame per 20 ms like discord.py."""
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.connected = True
+        self._playing = False
+        self._paused = threading.Event()
+        self._stopped = threading.Event()
+
+    def play(self, source, *, after=None):
+        if self._playing:
+            raise discord.ClientException("Already playing audio.")
+        self._playing = True
+        self._stopped = threading.Event()
+        self._paused.clear()
+        threading.Thread(
+            target=self._run, args=(source, after, self._stopped), daemon=True
+        ).start()
+
+    def _run(self, source, after, stopped):
+        next_frame = time.perf_counter()
+        while not stopped.is_set():
+            if self._paused.is_set():
+                stopped.wait(0.02)
+                next_frame = time.perf_counter()
+                continue
+            if not source.read():
+                break
+            next_frame += 0.02
+            delay = next_frame - time.perf_counter()
+            if delay > 0:
+                stopped.wait(delay)
+        self._playing = False
+        if after is not None:
+            after(None)
+
+    def is_playing(self):
+        return self._playing and not self._paused.is_set()
+
+    def is_paused(self):
+        return self._playing and self._paused.is_set()
+
+    def pause(self):
+        self._paused.set()
+
+    def resume(self):
+        self._paused.clear()
+
+    def stop(self):
+        self._stopped.set()
+
+    async def disconnect(self, force=False):
+        self.stop()
+        self.connected = False
+
+
+class FakeMessage:
+    async def edit(self, **kwargs):
+        pass
+
+    async def delete(self):
+        pass
+
+
+class FakeChannel:
+    def __init__(self):
+        self.sent = 0
+        self.errors = 0
+
+    async def send(self, content=None, **kwargs):
+        self.sent += 1
+        if content and content.startswith(("Error", "⚠️", "❌")):
+            self.errors += 1
+        return FakeMessage()
+
+
+class FakeContext:
+    """Just enough of commands.Context for the Music cog's commands."""
+
+    def __init__(self, guild, user_id):
+        self.guild = guild
+        self.channel = FakeChannel()
+        voice_channel = types.SimpleNamespace(id=guild.id)
+        self.author = types.SimpleNamespace(
+            id=user_id, voice=types.SimpleNamespace(channel=voice_channel)
+        )
+        guild.voice_client = FakeVoiceClient(voice_channel)
+
+    @property
+    def voice_client(self):
+        return self.guild.voice_client
+
+    def send(self, *args, **kwargs):
+        return self.channel.send(*args, **kwargs)
@@ -0,0 +1,250 @@
+"""Offline microbenchmarks for the library, queue and persistence hot paths.
+
+Builds a synthetic library and queue of each size, runs the Music cog
+against a fake YoutubeDL, and reports seconds per operation (lower is
+better). Results are compared with benchmarks/baseline.json; anything more
+than --tolerance slower than its baseline is flagged and makes the run exit
+with status 1. Baselines are machine specific, so record one with
+--save-baseline on the machine that runs the comparison.
+
+    python -m benchmarks.hot_paths
+    python -m benchmarks.hot_paths --sizes 1000,10000 --save-baseline
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import types
+import asyncio
+import argparse
+import tempfile
+import functools
+import contextlib
+
+from benchmarks.fakes import (
+    FakeGuild,
+    FakeYoutubeDL,
+    fake_bot,
+    fake_video_id,
+    install_fake_youtube_dl,
+    video_url,
+)
+
+install_fake_youtube_dl()
+
+from modules import music  # noqa: E402  (needs the fake YoutubeDL first)
+from modules.audio.playlist import cursor_url  # noqa: E402
+from modules.audio.queue_view import QueueView  # noqa: E402
+from modules.audio.store import TrackStore  # noqa: E402
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+GUILD_ID = 1234
+USER_ID = 100000000000
+
+
+@contextlib.contextmanager
+def quiet():
+    # The cog prints on every cache hit; keep that out of the results table
+    with open(os.devnull, "w") as devnull:
+        with contextlib.redirect_stdout(devnull):
+            yield
+
+
+def write_library_json(path, size):
+    now = time.time()
+    entries = {
+        video_url(i): {
+            "video_id": fake_video_id(i),
+            "title": f"Synthetic track {i}",
+            "filepath": f"/nonexistent/{fake_video_id(i)}.opus",
+            "codec": "opus",
+            "duration": 180 + i % 120,
+            "size": 4 * 1024 * 1024,
+            "last_access": now - i,
+            "verified_at": now,
+        }
+        for i in range(size)
+    }
+    with open(path, "w") as f:
+        json.dump(entries, f)
+
+
+async def make_cog(directory, size):
+    music.QUEUE_DIR = directory
+    music.LIBRARY_DB = os.path.join(directory, "library.db")
+    music.LIBRARY_FILE = os.path.join(directory, "library.json")
+    music.MAINTENANCE_LOCK = os.path.join(directory, "maintenance.lock")
+    music.track_store = TrackStore(os.path.join(directory, "tracks"))
+    music.ytdl_format_options["outtmpl"] = music.track_store.outtmpl
+    write_library_json(music.LIBRARY_FILE, size)
+
+    with quiet():
+        cog = music.Music(fake_bot())
+    await cog.bot.song_library.load_index()
+    return cog
+
+
+async def close_cog(cog):
+    with quiet():
+        await cog.cog_unload()
+
+
+def per_op(elapsed, ops):
+    return elapsed / max(ops, 1)
+
+
+async def bench_download_song_hit(cog, size, ops=2000):
+    urls = [video_url(random.randrange(size)) for _ in range(ops)]
+    with quiet():
+        start = time.perf_counter()
+        for url in urls:
+            await cog.download_song(url)
+        elapsed = time.perf_counter() - start
+    return per_op(elapsed, ops)
+
+
+async def bench_library_put(cog, size, ops=500):
+    library = cog.bot.song_library
+    start = time.perf_counter()
+    for i in range(size, size + ops):
+        await library.put(
+            video_url(i),
+            {"title": f"New track {i}", "filepath": f"/nonexistent/{i}.opus"},
+        )
+    return per_op(time.perf_counter() - start, ops)
+
+
+async def bench_queue_push(cog, size):
+    # What used to be save_queue(): the cost the event loop pays per change
+    journal = cog.queue_journal
+    start = time.perf_counter()
+    for i in range(size):
+        journal.push(GUILD_ID, [(video_url(i), USER_ID)])
+    elapsed = time.perf_counter() - start
+    await asyncio.wrap_future(journal.flush())
+    return per_op(elapsed, size)
+
+
+def bench_queue_snapshot(cog, size):
+    # Compaction rewrites the whole queue, off the loop but still bounded
+    journal = cog.queue_journal
+    start = time.perf_counter()
+    journal._compact(journal._snapshot())
+    return time.perf_counter() - start
+
+
+def bench_queue_render(cog, size, renders=200):
+    player = types.SimpleNamespace(
+        queue=cog.queue_journal.queue(GUILD_ID),
+        guild=FakeGuild(GUILD_ID),
+        is_playing=False,
+        current_song=None,
+        current_url=None,
+    )
+    view = QueueView(cog, player, USER_ID)
+    view.stop()
+    pages = view.pages
+    start = time.perf_counter()
+    for _ in range(renders):
+        view.page = random.randrange(pages)
+        view.render()
+    return per_op(time.perf_counter() - start, renders)
+
+
+async def bench_playlist_ingest(cog, size):
+    FakeYoutubeDL.playlist_size = size
+    run = functools.partial(cog.extractor.run, GUILD_ID)
+    journal = cog.queue_journal
+    journal.clear(GUILD_ID)
+
+    start = time.perf_counter()
+    cursor = cursor_url("https://www.youtube.com/playlist?list=PLbench", 0)
+    ingested = 0
+    while cursor is not None:
+        songs, cursor = await cog.playlists.read(cursor, run)
+        journal.push(GUILD_ID, [(url, USER_ID) for url, _ in songs])
+        ingested += len(songs)
+    elapsed = time.perf_counter() - start
+    assert ingested == size, ingested
+    return per_op(elapsed, ingested)
+
+
+async def run_size(size):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        cog = await make_cog(directory, size)
+        try:
+            results["download_song_hit"] = await bench_download_song_hit(cog, size)
+            results["library_put"] = await bench_library_put(cog, size)
+            results["queue_push"] = await bench_queue_push(cog, size)
+            results["queue_snapshot"] = bench_queue_snapshot(cog, size)
+            results["queue_render"] = bench_queue_render(cog, size)
+            results["playlist_ingest"] = await bench_playlist_ingest(cog, size)
+        finally:
+            await close_cog(cog)
+    return {f"{name}/{size}": value for name, value in results.items()}
+
+
+def format_time(seconds):
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.1f} µs"
+    if seconds < 1:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds:.2f} s"
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    print(f"{'benchmark':28}{'result':>12}{'baseline':>12}{'change':>10}")
+    for name, value in results.items():
+        base = baseline.get(name)
+        if base:
+            change = value / base - 1
+            flag = "  REGRESSION" if change > tolerance else ""
+            if flag:
+                regressions.append(name)
+            print(
+                f"{name:28}{format_time(value):>12}{format_time(base):>12}"
+                f"{change:>+10.0%}{flag}"
+            )
+        else:
+            print(f"{name:28}{format_time(value):>12}{'-':>12}{'':>10}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.3)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    results = {}
+    for size in (int(size) for size in args.sizes.split(",")):
+        results.update(asyncio.run(run_size(size)))
+
+    try:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        baseline = {}
+
+    regressions = compare(results, baseline, args.tolerance)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(dict(baseline, **results), f, indent=2, sort_keys=True)
+        print(f"Saved baseline to {args.baseline}")
+    elif regressions:
+        print(
+            f"{len(regressions)} benchmarks regressed by more than {args.tolerance:.0%}"
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""Multi-guild load simulator for the Music cog.
+
+Runs the real cog in-process against fake contexts, voice clients, audio
+sources and a fake YoutubeDL with configurable latency. Each simulated
+guild queues a few songs and then keeps issuing /play, /skip and /queue at
+random. For each guild count it reports event loop lag, command latency,
+CPU time per playing stream and memory growth.
+
+The voice fakes read a frame every 20 ms on one thread per guild, like
+discord.py does, but skip encryption and UDP. FFmpeg isn't run at all, so
+the CPU figures cover the bot process only.
+
+    python -m benchmarks.load_sim --guilds 10,50,100 --duration 60
+"""
+
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import warnings
+
+import discord
+
+from benchmarks.fakes import (
+    FakeAudio,
+    FakeContext,
+    FakeGuild,
+    FakeYoutubeDL,
+    fake_analyze,
+    fake_transcode,
+)
+from benchmarks.hot_paths import close_cog, make_cog, quiet
+from modules import music
+
+USER_ID = 100000000000
+COMMANDS = ("play", "skip", "queue")
+
+# The cog sends one progress message without awaiting it
+warnings.filterwarnings("ignore", message="coroutine .* was never awaited")
+
+
+def percentile(samples, q):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except FileNotFoundError:
+        pass
+    import resource
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+async def sample_lag(samples, interval=0.05):
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.perf_counter() - started - interval))
+
+
+async def run_command(cog, ctx, name, query, latencies):
+    started = time.perf_counter()
+    try:
+        if name == "play":
+            await cog.play.callback(cog, ctx, query=query)
+        elif name == "skip":
+            await cog.skip.callback(cog, ctx)
+        else:
+            await cog.show_queue.callback(cog, ctx)
+    finally:
+        latencies[name].append(time.perf_counter() - started)
+
+
+async def drive_guild(cog, ctx, args, rng, latencies):
+    # Stagger the guilds so they don't all start in the same tick
+    await asyncio.sleep(rng.uniform(0, args.ramp))
+    for _ in range(args.initial_songs):
+        query = f"song {rng.randrange(args.catalog)}"
+        await run_command(cog, ctx, "play", query, latencies)
+
+    weights = (args.play_weight, args.skip_weight, args.queue_weight)
+    while True:
+        await asyncio.sleep(rng.expovariate(1 / args.think))
+        name = rng.choices(COMMANDS, weights)[0]
+        query = f"song {rng.randrange(args.catalog)}"
+        await run_command(cog, ctx, name, query, latencies)
+
+
+async def simulate(guild_count, args):
+    rng = random.Random(args.seed)
+    latencies = {name: [] for name in COMMANDS}
+    lag = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        cog = await make_cog(directory, args.library)
+        contexts = [FakeContext(FakeGuild(i + 1), USER_ID) for i in range(guild_count)]
+        cog.bot.voice_clients = [ctx.voice_client for ctx in contexts]
+
+        rss_before = rss_bytes()
+        lag_task = asyncio.create_task(sample_lag(lag))
+        drivers = [
+            asyncio.create_task(
+                drive_guild(cog, ctx, args, random.Random(rng.random()), latencies)
+            )
+            for ctx in contexts
+        ]
+
+        # Let every guild get going before measuring the steady state
+        await asyncio.sleep(args.ramp)
+        lag.clear()
+        for samples in latencies.values():
+            samples.clear()
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        streams = []
+        while time.perf_counter() - wall_start < args.duration:
+            await asyncio.sleep(1)
+            streams.append(sum(ctx.voice_client.is_playing() for ctx in contexts))
+        cpu = time.process_time() - cpu_start
+        wall = time.perf_counter() - wall_start
+        rss_after = rss_bytes()
+
+        for task in drivers + [lag_task]:
+            task.cancel()
+        await asyncio.gather(*drivers, lag_task, return_exceptions=True)
+        await close_cog(cog)
+        # Voice threads call back into the loop, so it has to outlive them
+        for ctx in contexts:
+            ctx.voice_client.stop()
+        while any(ctx.voice_client.is_playing() for ctx in contexts):
+            await asyncio.sleep(0.02)
+        errors = sum(ctx.channel.errors for ctx in contexts)
+
+    average_streams = sum(streams) / len(streams) if streams else 0
+    return {
+        "guilds": guild_count,
+        "streams": average_streams,
+        "lag_p50": percentile(lag, 0.5),
+        "lag_p99": percentile(lag, 0.99),
+        "lag_max": max(lag, default=0.0),
+        "latency_p95": {
+            name: percentile(samples, 0.95) for name, samples in latencies.items()
+        },
+        "commands": sum(len(samples) for samples in latencies.values()),
+        "cpu_percent": 100 * cpu / wall,
+        "cpu_per_stream": 100 * cpu / wall / average_streams if average_streams else 0,
+        "rss_growth": rss_after - rss_before,
+        "errors": errors,
+    }
+
+
+def report(results):
+    print(
+        f"{'guilds':>7}{'streams':>9}{'lag p50':>9}{'lag p99':>9}{'lag max':>9}"
+        f"{'play p95':>10}{'skip p95':>10}{'queue p95':>10}{'cmds':>7}"
+        f"{'cpu %':>7}{'%/stream':>9}{'rss +MiB':>9}{'errors':>7}"
+    )
+    for r in results:
+        latency = r["latency_p95"]
+        print(
+            f"{r['guilds']:>7}{r['streams']:>9.1f}"
+            f"{r['lag_p50'] * 1000:>7.1f}ms{r['lag_p99'] * 1000:>7.1f}ms"
+            f"{r['lag_max'] * 1000:>7.1f}ms"
+            f"{latency['play'] * 1000:>8.0f}ms{latency['skip'] * 1000:>8.0f}ms"
+            f"{latency['queue'] * 1000:>8.0f}ms{r['commands']:>7}"
+            f"{r['cpu_percent']:>7.1f}{r['cpu_per_stream']:>9.2f}"
+            f"{r['rss_growth'] / 1024**2:>9.1f}{r['errors']:>7}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--guilds", default="10,50,100")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--ramp", type=float, default=5)
+    parser.add_argument(
+        "--think", type=float, default=5, help="mean seconds between commands"
+    )
+    parser.add_argument("--initial-songs", type=int, default=3)
+    parser.add_argument("--catalog", type=int, default=500)
+    parser.add_argument("--library", type=int, default=1000)
+    parser.add_argument("--track-seconds", type=float, default=20)
+    parser.add_argument("--ytdl-latency", type=float, default=0.3)
+    parser.add_argument("--download-latency", type=float, default=2.0)
+    parser.add_argument("--play-weight", type=float, default=3)
+    parser.add_argument("--skip-weight", type=float, default=1)
+    parser.add_argument("--queue-weight", type=float, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    FakeYoutubeDL.latency = args.ytdl_latency
+    FakeYoutubeDL.download_latency = args.download_latency
+    FakeAudio.track_seconds = args.track_seconds
+    music.OpusSource = FakeAudio
+    music.transcode = fake_transcode
+    music.analyze = fake_analyze
+    discord.FFmpegPCMAudio = FakeAudio
+
+    results = []
+    for guild_count in (int(count) for count in args.guilds.split(",")):
+        print(f"Simulating {guild_count} guilds...", flush=True)
+        with quiet():
+            results.append(asyncio.run(simulate(guild_count, args)))
+    report(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Compare the queue journal against rewriting the whole queue file.
+
+Simulates a playlist being queued one track at a time and then played
+through, the pattern that made save_queue() quadratic.
+
+    python -m benchmarks.queue_journal --tracks 2000
+"""
+
+import os
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+from collections import deque
+
+from modules.audio.journal import QueueJournal
+
+GUILD_ID = 1234
+
+
+def track(i):
+    return (f"https://www.youtube.com/watch?v=video{i:07d}", 100000000000 + i)
+
+
+def bench_whole_file(directory, tracks, pops):
+    path = os.path.join(directory, "queue.json")
+    queue = deque()
+
+    start = time.perf_counter()
+    for i in range(tracks):
+        queue.append(track(i))
+        with open(path, "w") as f:
+            json.dump(list(queue), f)
+    for _ in range(pops):
+        queue.popleft()
+        with open(path, "w") as f:
+            json.dump(list(queue), f)
+    elapsed = time.perf_counter() - start
+    # Every write happens on the caller (the event loop)
+    return elapsed, elapsed
+
+
+async def bench_journal(directory, tracks, pops):
+    journal = QueueJournal(directory)
+
+    start = time.perf_counter()
+    for i in range(tracks):
+        journal.push(GUILD_ID, [track(i)])
+    for _ in range(pops):
+        journal.pop(GUILD_ID)
+    on_loop = time.perf_counter() - start
+
+    await asyncio.get_running_loop().run_in_executor(None, journal.close)
+    total = time.perf_counter() - start
+
+    recovered = QueueJournal(directory)
+    assert list(recovered.queue(GUILD_ID)) == list(journal.queue(GUILD_ID))
+    recovered.close()
+    return on_loop, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=2000)
+    parser.add_argument("--pops", type=int, default=None)
+    args = parser.parse_args()
+    pops = args.pops if args.pops is not None else args.tracks // 2
+
+    with tempfile.TemporaryDirectory() as whole_dir:
+        whole = bench_whole_file(whole_dir, args.tracks, pops)
+    with tempfile.TemporaryDirectory() as journal_dir:
+        journal = asyncio.run(bench_journal(journal_dir, args.tracks, pops))
+
+    print(f"{args.tracks} appends + {pops} pops")
+    print(f"{'':14}{'on loop (s)':>14}{'total (s)':>14}")
+    print(f"{'whole file':14}{whole[0]:>14.4f}{whole[1]:>14.4f}")
+    print(f"{'journal':14}{journal[0]:>14.4f}{journal[1]:>14.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""Runs the bot from main2.py as several worker processes.
+
+Each worker is a complete bot owning a contiguous range of the shards, with
+its own gateway connections, yt-dlp threads and voice players, so they
+spread over as many cores. They share the track cache in ./YTmusic and the
+library database:
+
+- SQLite in WAL mode handles concurrent readers and writers itself;
+- a track is downloaded by one worker at a time (under a byte-range lock
+  in YTmusic/.downloads.lock), the others wait for it and use what it stored;
+- tracks queued or playing in any worker are pinned in the library, so the
+  worker evicting from the cache leaves them alone;
+- finished downloads are committed by atomic rename;
+- one worker at a time (whoever holds data/maintenance.lock) verifies the
+  library and evicts from the cache;
+- workers take turns identifying through data/identify.lock.
+
+Queues are journalled per worker in ./data/worker-N. Guilds stay on their
+shard as long as the worker and shard counts don't change; after changing
+them, queues start out empty.
+
+A supervisor restarts workers that crash, backing off while one keeps
+crashing. A worker that exits cleanly is left stopped.
+
+    python launcher.py            # WORKERS workers, shard count from Discord
+    python launcher.py 4 16       # 4 workers sharing 16 shards
+"""
+
+import sys
+import time
+import signal
+import asyncio
+import multiprocessing
+
+import discord
+
+import main2
+from conf import conf2
+
+WORKERS = 2
+# None asks Discord for its recommended shard count
+SHARD_COUNT = None
+
+# Seconds before restarting a crashed worker, doubling per crash in a row up
+# to MAX_RESTART_DELAY; a worker that stayed up STABLE_AFTER seconds starts
+# over from RESTART_DELAY
+RESTART_DELAY = 5
+MAX_RESTART_DELAY = 300
+STABLE_AFTER = 600
+# How long workers get to close their connections before they are killed
+SHUTDOWN_TIMEOUT = 20
+POLL_INTERVAL = 1
+
+
+def recommended_shards(token):
+    async def fetch():
+        client = discord.Client(intents=discord.Intents.none())
+        async with client:
+            await client.login(token)
+            shards, _, _ = await client.http.get_bot_gateway()
+            return shards
+
+    return asyncio.run(fetch())
+
+
+def shard_ranges(shard_count, workers):
+    # Contiguous and as even as possible; never more workers than shards
+    workers = max(1, min(workers, shard_count))
+    per_worker, extra = divmod(shard_count, workers)
+    ranges = []
+    start = 0
+    for worker in range(workers):
+        size = per_worker + (1 if worker < extra else 0)
+        ranges.append(list(range(start, start + size)))
+        start += size
+    return ranges
+
+
+def run_worker(worker, shard_ids, shard_count):
+    # Ctrl+C reaches the whole process group; let the supervisor handle it
+    # and shut down on the SIGTERM it sends instead
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        asyncio.run(main2.main(worker, shard_ids, shard_count))
+    except KeyboardInterrupt:
+        pass
+
+
+class Supervisor:
+    """Starts one process per shard range and restarts the ones that crash."""
+
+    def __init__(self, ranges, shard_count):
+        self.ranges = ranges
+        self.shard_count = shard_count
+        # Workers are spawned, not forked, so each starts from a clean slate
+        self.context = multiprocessing.get_context("spawn")
+        self.processes = {}
+        self.started_at = {}
+        self.crashes = {}
+        self.restart_at = {}
+        self.stopping = False
+
+    def start(self, worker):
+        shard_ids = self.ranges[worker]
+        process = self.context.Process(
+            target=run_worker,
+            args=(worker, shard_ids, self.shard_count),
+            name=f"bot-worker-{worker}",
+        )
+        process.start()
+        self.processes[worker] = process
+        self.started_at[worker] = time.monotonic()
+        print(
+            f"Started worker {worker} (pid {process.pid}) "
+            f"for shards {shard_ids[0]}-{shard_ids[-1]} of {self.shard_count}"
+        )
+
+    def check(self):
+        now = time.monotonic()
+        for worker, process in list(self.processes.items()):
+            if process.is_alive():
+                continue
+            del self.processes[worker]
+            if process.exitcode == 0:
+                print(f"Worker {worker} stopped")
+                continue
+
+            if now - self.started_at[worker] >= STABLE_AFTER:
+                self.crashes[worker] = 0
+            self.crashes[worker] = self.crashes.get(worker, 0) + 1
+            delay = min(
+                RESTART_DELAY * 2 ** (self.crashes[worker] - 1), MAX_RESTART_DELAY
+            )
+            print(
+                f"Worker {worker} exited with code {process.exitcode}, "
+                f"restarting in {delay}s"
+            )
+            self.restart_at[worker] = now + delay
+
+        for worker, restart_at in list(self.restart_at.items()):
+            if now >= restart_at:
+                del self.restart_at[worker]
+                self.start(worker)
+
+    def stop(self, signum=None, frame=None):
+        self.stopping = True
+
+    def shutdown(self):
+        processes = list(self.processes.values())
+        for process in processes:
+            process.terminate()
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        for process in processes:
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                print(f"{process.name} didn't stop in time, killing it")
+                process.kill()
+                process.join()
+
+    def run(self):
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        for worker in range(len(self.ranges)):
+            self.start(worker)
+        try:
+            while not self.stopping and (self.processes or self.restart_at):
+                self.check()
+                time.sleep(POLL_INTERVAL)
+        finally:
+            print("Shutting down workers...")
+            self.shutdown()
+
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else WORKERS
+    shard_count = int(sys.argv[2]) if len(sys.argv) > 2 else SHARD_COUNT
+    if shard_count is None:
+        shard_count = recommended_shards(conf2.TOKEN)
+        print(f"Discord recommends {shard_count} shards")
+    # Fewer shards than workers would leave workers with nothing to do
+    shard_count = max(shard_count, workers)
+
+    Supervisor(shard_ranges(shard_count, workers), shard_count).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,11 @@ import os
 import json
 from collections import deque
 from conf import conf2
+from modules.audio.library import Library
+from modules.audio.playlist import PlaylistReader, cursor_url, is_cursor
+from modules.audio.search_cache import SearchCache
+from modules.audio.store import TrackStore
+from modules.audio.urls import canonical_url
 
 
 # Bot configuration
@@ -13,10 +18,12 @@ TOKEN = conf2.TOKEN
 PREFIX = "/"
 SONGS_DIR = "songs"
 QUEUE_FILE = "song_queue.json"
+LIBRARY_DB = "song_library.db"
 LIBRARY_FILE = "song_library.json"
 
 # Ensure songs directory exists
 os.makedirs(SONGS_DIR, exist_ok=True)
+track_store = TrackStore(SONGS_DIR)
 
 # Initialize bot
 intents = discord.Intents.default()
@@ -27,24 +34,26 @@ bot = commands.Bot(command_prefix=PREFIX, intents=intents)
 song_queue = deque()
 current_song = None
 is_playing = False
-song_library = {}
-
-# Load existing library if available
-if os.path.exists(LIBRARY_FILE):
-    with open(LIBRARY_FILE, "r") as f:
-        song_library = json.load(f)
+# Imports song_library.json on first run
+song_library = Library(LIBRARY_DB, legacy_json=LIBRARY_FILE)
+search_cache = SearchCache(song_library)
 
 # Load queue if available
 # In the initialization part (replace the queue loading code):
 if os.path.exists(QUEUE_FILE):
     with open(QUEUE_FILE, "r") as f:
         saved_queue = json.load(f)
-        song_queue = deque(saved_queue)  # Just load the (url, user_id) pairs directly
+        # (url, user_id) pairs; the library is keyed by canonical URLs, older
+        # queue files may hold other forms
+        song_queue = deque(
+            (url if is_cursor(url) else canonical_url(url), user_id)
+            for url, user_id in saved_queue
+        )
 
 # YTDL options
 ytdl_format_options = {
     "format": "bestaudio/best",
-    "outtmpl": os.path.join(SONGS_DIR, "%(title)s.%(ext)s"),
+    "outtmpl": track_store.outtmpl,
     "restrictfilenames": True,
     "noplaylist": True,
     "nocheckcertificate": True,
@@ -67,6 +76,15 @@ ffmpeg_options = {"options": "-vn"}
 
 ytdl = youtube_dl.YoutubeDL(ytdl_format_options)
 
+# Playlists are queued as a cursor that is read a window at a time
+playlist_reader = PlaylistReader(
+    {
+        "extract_flat": True,
+        "quiet": True,
+        "no_warnings": True,
+    }
+)
+
 
 class YTDLSource(discord.PCMVolumeTransformer):
     def __init__(self, source, *, data, volume=0.5):
@@ -98,12 +116,9 @@ def save_queue():
         json.dump(list(song_queue), f)
 
 
-def save_library():
-    with open(LIBRARY_FILE, "w") as f:
-        json.dump(song_library, f)
-
-
 async def download_song(url):
+    # Library entries are keyed by one URL per video
+    url = canonical_url(url)
     try:
         # Check if song already exists in library with valid file
         if url in song_library:
@@ -132,28 +147,65 @@ async def download_song(url):
         if not os.path.exists(mp3_file):
             raise Exception("Downloaded file not found")
 
-        # Add to library
-        song_library[url] = {
-            "title": data.get("title", "Unknown Title"),
-            "filepath": mp3_file,
-            "duration": data.get("duration", 0),
-            "thumbnail": data.get("thumbnail", ""),
-        }
+        mp3_file = await bot.loop.run_in_executor(
+            None,
+            track_store.commit,
+            mp3_file,
+            data.get("extractor_key", "generic"),
+            data["id"],
+        )
 
-        save_library()
+        # Add to library
+        await song_library.put(
+            url,
+            {
+                "video_id": data.get("id"),
+                "title": data.get("title", "Unknown Title"),
+                "filepath": mp3_file,
+                "duration": data.get("duration", 0),
+                "thumbnail": data.get("thumbnail", ""),
+            },
+        )
         return mp3_file
     except Exception as e:
         print(f"Error downloading song {url}: {e}")
         # Remove invalid library entry if it exists
         if url in song_library:
-            del song_library[url]
-            save_library()
+            await song_library.remove(url)
         return None
 
 
+async def read_playlist(cursor, user_id):
+    songs, next_cursor = await playlist_reader.read(
+        cursor, lambda fn: bot.loop.run_in_executor(None, fn)
+    )
+    items = [(song_url, user_id) for song_url, _ in songs]
+    if next_cursor is not None:
+        items.append((next_cursor, user_id))
+    return items
+
+
+async def expand_playlist(ctx):
+    # Swap a playlist cursor at the front for its next window of songs
+    while len(song_queue) > 0 and is_cursor(song_queue[0][0]):
+        cursor, user_id = song_queue[0]
+        try:
+            items = await read_playlist(cursor, user_id)
+        except Exception as e:
+            print(f"Failed to read playlist {cursor}: {e}")
+            await ctx.send(f"Couldn't load more of the playlist: {e}")
+            items = []
+
+        if len(song_queue) > 0 and song_queue[0][0] == cursor:
+            song_queue.popleft()
+            song_queue.extendleft(reversed(items))
+            save_queue()
+
+
 async def play_next(ctx):
     global current_song, is_playing
 
+    await expand_playlist(ctx)
     if len(song_queue) > 0:
         is_playing = True
         url, user_id = song_queue.popleft()
@@ -249,16 +301,20 @@ async def play(ctx, *, query):
     if query.startswith("http"):
         url = query
     else:
+        url = search_cache.get(query)
+    if url is None:
         # Search YouTube
         search_query = f"ytsearch:{query}"
         data = await bot.loop.run_in_executor(
             None, lambda: ytdl.extract_info(search_query, download=False)
         )
         if "entries" in data:
-            url = data["entries"][0]["webpage_url"]
+            url = canonical_url(data["entries"][0]["webpage_url"])
+            search_cache.put(query, url)
         else:
             await ctx.send("No results found!")
             return
+    url = canonical_url(url)
 
     # Download the song (or use existing)
     filepath = await download_song(url)
@@ -291,31 +347,19 @@ async def play_playlist(ctx, url):
         await ctx.voice_client.move_to(voice_channel)
 
     try:
-        # Extract playlist info
-        ydl_opts = {
-            "extract_flat": True,
-            "quiet": True,
-            "no_warnings": True,
-        }
-
-        with youtube_dl.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-
-            if "entries" not in info:
-                await ctx.send("This doesn't appear to be a playlist!")
-                return
+        # Only the first window is read now, the rest as the queue plays
+        items = await read_playlist(cursor_url(url, 0), ctx.author.id)
+        if not items:
+            await ctx.send("This doesn't appear to be a playlist!")
+            return
 
-            # Add all playlist songs to queue
-            count = 0
-            for entry in info["entries"]:
-                song_url = f"https://youtube.com/watch?v={entry['id']}"
-                song_queue.append((song_url, ctx.author.id))  # Changed to ctx.author.id
-                count += 1
-            save_queue()
-            await ctx.send(f"Added {count} songs from playlist to queue!")
+        song_queue.extend(items)
+        save_queue()
+        count = sum(1 for song_url, _ in items if not is_cursor(song_url))
+        await ctx.send(f"Added {count} songs from playlist to queue!")
 
-            if not is_playing:
-                await play_next(ctx)
+        if not is_playing:
+            await play_next(ctx)
     except Exception as e:
         await ctx.send(f"Error processing playlist: {e}")
 
@@ -340,6 +384,9 @@ async def show_queue(ctx):
         for i, (url, user_id) in enumerate(song_queue, 1):
             member = ctx.guild.get_member(user_id)
             mention = member.mention if member else f"User {user_id}"
+            if is_cursor(url):
+                queue_list.append(f"{i}. Rest of the playlist (requested by {mention})")
+                continue
             title = (
                 song_library.get(url, {}).get("title", "Unknown Title")
                 if url in song_library
@@ -6,13 +6,67 @@ import json
 import asyncio
 from collections import deque
 
+from modules.audio.locks import FileLock
+
 PREFIX = "/"
-# Create bot instance with command prefix
-bot = commands.Bot(command_prefix=PREFIX, intents=discord.Intents.all())
+
+# Worker processes started by launcher.py take turns identifying through
+# this lock file, waiting this long after each other
+IDENTIFY_LOCK = "./data/identify.lock"
+IDENTIFY_INTERVAL = 5
+
+
+class ShardedBot(commands.AutoShardedBot):
+    """The bot as one worker process of launcher.py, running some of the shards."""
+
+    def __init__(self, worker, **kwargs):
+        super().__init__(**kwargs)
+        self.worker = worker
+        self.identify_lock = FileLock(IDENTIFY_LOCK)
+        self._identifying = asyncio.Lock()
+
+    async def before_identify_hook(self, shard_id, *, initial=False):
+        # Discord rate limits IDENTIFY per bot, not per process
+        async with self._identifying:
+            while not self.identify_lock.acquire():
+                await asyncio.sleep(0.5)
+            try:
+                await asyncio.sleep(IDENTIFY_INTERVAL)
+            finally:
+                self.identify_lock.release()
+
+
+# Create bot instance with command prefix; sharded when run by launcher.py
+def create_bot(worker=None, shard_ids=None, shard_count=None):
+    if worker is None:
+        bot = commands.Bot(command_prefix=PREFIX, intents=discord.Intents.all())
+        bot.worker = None
+    else:
+        bot = ShardedBot(
+            worker,
+            command_prefix=PREFIX,
+            intents=discord.Intents.all(),
+            shard_ids=shard_ids,
+            shard_count=shard_count,
+        )
+
+    @bot.event
+    async def on_ready():
+        print(f"Logged in as {bot.user.name} ({bot.user.id})")
+        if bot.worker is not None:
+            print(f"Running shards {bot.shard_ids} of {bot.shard_count}")
+        await bot.change_presence(
+            activity=discord.Activity(
+                type=discord.ActivityType.listening, name=f"{PREFIX}play"
+            )
+        )
+        print("------")
+
+    return bot
 
 
 # Load all modules from the modules folder
-async def load_modules():
+async def load_modules(bot):
     for filename in os.listdir("./modules"):
         if filename.endswith(".py") and not filename.startswith("__"):
             try:
@@ -22,21 +76,12 @@ async def load_modules():
                 print(f"Failed to load module {filename}: {e}")
 
 
-@bot.event
-async def on_ready():
-    print(f"Logged in as {bot.user.name} ({bot.user.id})")
-    await bot.change_presence(
-        activity=discord.Activity(
-            type=discord.ActivityType.listening, name=f"{PREFIX}play"
-        )
-    )
-    print("------")
-
-
 # Run the bot
-async def main():
-    await load_modules()
-    await bot.start(conf2.TOKEN)
+async def main(worker=None, shard_ids=None, shard_count=None):
+    bot = create_bot(worker, shard_ids, shard_count)
+    async with bot:
+        await load_modules(bot)
+        await bot.start(conf2.TOKEN)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,118 @@
+import time
+import asyncio
+
+# Once over budget, evict down to this fraction of it so we don't thrash
+LOW_WATER = 0.9
+# Seconds between batched access updates / eviction checks
+FLUSH_INTERVAL = 30
+# Pins a process hasn't refreshed for this long are from one that is gone
+PIN_EXPIRY = 10 * FLUSH_INTERVAL
+# The size of the cache is counted as tracks are added and evicted, and only
+# summed up from the library this often (other processes add to it too)
+RESYNC_INTERVAL = 10 * 60
+
+
+class CacheManager:
+    """Keeps the downloaded tracks under a byte budget.
+
+    Plays are counted in memory and written to the library in batches.
+    When the cache grows past the budget, the coldest tracks (see
+    ``Library.eviction_candidates``) are evicted in the background, skipping
+    anything ``pinned()`` reports as queued or playing.
+
+    With several bot processes sharing the cache, only the one holding
+    ``lock`` evicts, against the size of the whole library. Every process
+    publishes its pins to the library as ``owner`` each round, and the
+    evicting one skips all of them; a track queued elsewhere in the last
+    FLUSH_INTERVAL seconds is only protected by being recently used.
+    """
+
+    def __init__(self, library, budget, pinned, lock=None, owner=0):
+        self.library = library
+        self.budget = budget
+        self.pinned = pinned
+        self.lock = lock
+        self.owner = owner
+        self.total = 0
+        self.evicted = 0
+        self._ready = False
+        self._synced_at = 0.0
+
+        self._touches = {}
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self.run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def touch(self, url):
+        count, _ = self._touches.get(url, (0, 0))
+        self._touches[url] = (count + 1, time.time())
+
+    def added(self, size):
+        self.total += size
+        if self.total > self.budget:
+            self._wakeup.set()
+
+    async def run(self):
+        while True:
+            try:
+                await self.maintain()
+            except Exception as e:
+                # Tried again next round, startup included
+                print(f"Cache maintenance failed: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def maintain(self):
+        if not self._ready:
+            await self.library.backfill_sizes()
+            self.total = await self.library.total_size()
+            self._synced_at = time.monotonic()
+            self._ready = True
+        await self.flush()
+        if self.lock is not None:
+            await self.library.put_pins(self.owner, self.pinned(), time.time())
+            if not self.lock.acquire():
+                # Another process looks after the cache
+                return
+        if time.monotonic() - self._synced_at >= RESYNC_INTERVAL:
+            self.total = await self.library.total_size()
+            self._synced_at = time.monotonic()
+        if self.total > self.budget:
+            await self.evict()
+
+    async def flush(self):
+        if self._touches:
+            touches, self._touches = self._touches, {}
+            await self.library.touch_many(touches)
+
+    async def evict(self):
+        target = self.budget * LOW_WATER
+        pinned = self.pinned()
+        if self.lock is not None:
+            pinned |= await self.library.pinned_urls(time.time() - PIN_EXPIRY)
+        victims = []
+        removed = 0
+        for url, filepath, size in await self.library.eviction_candidates():
+            if self.total - removed <= target:
+                break
+            if url in pinned:
+                continue
+            victims.append(url)
+            removed += size or 0
+
+        if not victims:
+            return
+        freed = await self.library.evict(victims)
+        self.total -= removed
+        self.evicted += len(victims)
+        print(f"Evicted {len(victims)} tracks, freed {freed / 1024 / 1024:.1f} MiB")
@@ -0,0 +1,32 @@
+import asyncio
+
+
+class DownloadPool:
+    """Runs a download coroutine over many URLs with bounded concurrency.
+
+    Results are handed back in the order the URLs were given, each one as
+    soon as it and everything before it has finished.
+    """
+
+    def __init__(self, download, workers=4):
+        self.download = download
+        self.workers = max(1, workers)
+
+    async def map(self, urls):
+        semaphore = asyncio.Semaphore(self.workers)
+
+        async def fetch(url):
+            async with semaphore:
+                return await self.download(url)
+
+        tasks = [asyncio.ensure_future(fetch(url)) for url in urls]
+        try:
+            for url, task in zip(urls, tasks):
+                try:
+                    yield url, await task, None
+                except Exception as e:
+                    yield url, None, e
+        finally:
+            # Consumer went away (or failed); don't keep downloading for it
+            for task in tasks:
+                task.cancel()
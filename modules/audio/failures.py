@@ -0,0 +1,142 @@
+import time
+import random
+import asyncio
+
+from yt_dlp.utils import ExtractorError, GeoRestrictedError
+
+from modules.audio.library import log_write_error
+
+# How a failed extraction should be treated
+PERMANENT = "permanent"  # the video is gone or locked, retrying won't help
+RATE_LIMITED = "rate_limited"  # upstream is pushing back on all of us
+TRANSIENT = "transient"  # anything else: network trouble, FFmpeg hiccups
+
+RATE_LIMIT_MARKERS = (
+    "http error 429",
+    "too many requests",
+    "confirm you're not a bot",
+    "confirm you’re not a bot",
+    "rate-limited",
+)
+# Only what the extractor says about the video itself; an HTTP error on a
+# single fragment or format says nothing about whether it is playable
+PERMANENT_MARKERS = (
+    "video unavailable",
+    "private video",
+)
+
+# Permanent failures are trusted for this long; videos do come back (a
+# private video made public again, a region lock lifted)
+FAILURE_TTL = 24 * 60 * 60
+
+
+class Unavailable(Exception):
+    """The URL failed permanently not long ago; it isn't tried again yet."""
+
+
+class RateLimited(Exception):
+    """Extraction is paused because upstream is rate limiting us."""
+
+
+def classify(error):
+    if isinstance(error, Unavailable):
+        return PERMANENT
+    if isinstance(error, RateLimited):
+        return RATE_LIMITED
+    # yt-dlp wraps the extractor's error in a DownloadError
+    cause = getattr(error, "exc_info", None)
+    cause = cause[1] if cause else error
+    message = str(error).lower()
+    if any(marker in message for marker in RATE_LIMIT_MARKERS):
+        return RATE_LIMITED
+    if isinstance(cause, GeoRestrictedError):
+        return PERMANENT
+    if isinstance(cause, ExtractorError) and cause.expected:
+        # yt-dlp's way of saying "not a bug, the site said no"; covers
+        # removed, members-only and unsupported URLs too
+        return PERMANENT
+    if any(marker in message for marker in PERMANENT_MARKERS):
+        return PERMANENT
+    return TRANSIENT
+
+
+def backoff(attempt, base, limit):
+    """Seconds to wait before retry ``attempt`` (0-based), with jitter.
+
+    Doubles per attempt up to ``limit``; the actual wait is somewhere in
+    the upper half, so failures at the same moment don't retry together.
+    """
+    delay = min(base * 2**attempt, limit)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class FailureCache:
+    """URLs that failed permanently, and why, stored in the library database.
+
+    Every lookup goes to the database, so a failure seen by one worker
+    process spares the others the same attempt.
+    """
+
+    def __init__(self, library, ttl=FAILURE_TTL):
+        self.library = library
+        self.ttl = ttl
+        self.hits = 0
+
+    def get(self, url):
+        item = self.library.get_failure(url)
+        if item is not None and time.time() - item[1] < self.ttl:
+            self.hits += 1
+            return item[0]
+        return None
+
+    def put(self, url, error):
+        # The last line is yt-dlp's actual reason, without the traceback
+        lines = str(error).strip().splitlines()
+        reason = lines[-1][:300] if lines else type(error).__name__
+        written = self.library.put_failure(url, reason, time.time())
+        written.add_done_callback(log_write_error)
+
+    def prune(self):
+        pruned = self.library.prune_failures(time.time() - self.ttl)
+        pruned.add_done_callback(log_write_error)
+        return pruned
+
+
+class CircuitBreaker:
+    """Pauses all extraction for a while once upstream starts rate limiting.
+
+    Each trip opens the breaker for ``cooldown`` seconds, doubling while
+    trips follow each other without a success in between, up to
+    ``max_cooldown``. Failures of calls that were already running when it
+    opened don't count as further trips.
+    """
+
+    def __init__(self, cooldown, max_cooldown):
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.open_until = 0.0
+        self.trips = 0
+        self.total_trips = 0
+
+    @property
+    def is_open(self):
+        return time.monotonic() < self.open_until
+
+    def remaining(self):
+        return max(0.0, self.open_until - time.monotonic())
+
+    async def wait(self):
+        while self.is_open:
+            await asyncio.sleep(self.remaining())
+
+    def trip(self):
+        if self.is_open:
+            return
+        self.trips += 1
+        self.total_trips += 1
+        cooldown = min(self.cooldown * 2 ** (self.trips - 1), self.max_cooldown)
+        self.open_until = time.monotonic() + cooldown
+        print(f"Rate limited by upstream, pausing extraction for {cooldown:.0f}s")
+
+    def succeeded(self):
+        self.trips = 0
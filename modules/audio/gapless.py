@@ -0,0 +1,154 @@
+import audioop
+import threading
+import collections
+
+import discord
+
+# One 20 ms frame of 16-bit stereo PCM at 48 kHz
+FRAME_BYTES = 3840
+FRAMES_PER_SECOND = 50
+
+
+class TrackChain(discord.AudioSource):
+    """One audio source for the voice client that runs several tracks together.
+
+    The voice thread keeps reading from the chain; when the current track
+    runs dry the chain carries on with the track prepared behind it, whose
+    FFmpeg was started and whose first frames were read ahead of time, so
+    nothing has to be spawned between two packets. Without a prepared track
+    the chain ends like any other source and ``after`` fires as usual.
+
+    Two PCM tracks can be crossfaded over their last/first ``crossfade``
+    frames. Opus passthrough tracks can't be mixed and simply follow on.
+    """
+
+    def __init__(self, source, on_advance, prebuffer=50, crossfade=0):
+        self.current = source
+        # Frames read from the current track, to know how much of it is left
+        self.position = 0
+        self.upcoming = None
+        self.on_advance = on_advance
+        self.prebuffer = prebuffer
+        self.crossfade = crossfade
+
+        # Frames read ahead for the current and the upcoming track
+        self._head = collections.deque()
+        self._buffer = collections.deque()
+        self._buffered = threading.Event()
+        self._lock = threading.Lock()
+
+    def seconds_left(self):
+        duration = getattr(self.current, "duration", None)
+        if not duration:
+            return None
+        return max(0.0, duration - self.position / FRAMES_PER_SECOND)
+
+    def prepare(self, source):
+        # Called on the event loop; filling the buffer blocks, so it gets a thread
+        buffer = collections.deque()
+        buffered = threading.Event()
+        with self._lock:
+            previous = self.upcoming
+            self.upcoming = source
+            self._buffer = buffer
+            self._buffered = buffered
+        if previous is not None:
+            previous.cleanup()
+        threading.Thread(
+            target=self._fill,
+            args=(source, buffer, buffered),
+            name="track-prebuffer",
+            daemon=True,
+        ).start()
+
+    def discard_upcoming(self):
+        # False if there was nothing left to discard, e.g. it is playing already
+        with self._lock:
+            upcoming, self.upcoming = self.upcoming, None
+            self._buffer = collections.deque()
+        if upcoming is None:
+            return False
+        upcoming.cleanup()
+        return True
+
+    def _fill(self, source, buffer, buffered):
+        try:
+            for _ in range(self.prebuffer):
+                if self.upcoming is not source:
+                    break
+                data = source.read()
+                if not data:
+                    break
+                buffer.append(data)
+        except Exception as e:
+            print(f"Prebuffering the next track failed: {e}")
+        finally:
+            buffered.set()
+
+    def _take(self, source, buffer):
+        if buffer:
+            return buffer.popleft()
+        return source.read()
+
+    def read(self):
+        data = self._take(self.current, self._head)
+        if data:
+            self.position += 1
+            return self._mix(data) if self.crossfade else data
+
+        with self._lock:
+            upcoming, buffer, buffered = self.upcoming, self._buffer, self._buffered
+        if upcoming is None:
+            return b""
+        # Only waits if it was prepared too late to have started already
+        buffered.wait()
+        with self._lock:
+            if self.upcoming is not upcoming:
+                # Discarded while it was starting up
+                return b""
+            finished = self.current
+            self.current = upcoming
+            self.upcoming = None
+            self._buffer = collections.deque()
+            self.position = 0
+
+        self._head = buffer
+        finished.cleanup()
+        self.on_advance(upcoming)
+        data = self._take(upcoming, buffer)
+        if data:
+            self.position += 1
+        return data
+
+    def _mix(self, data):
+        left = self.seconds_left()
+        if left is None or left * FRAMES_PER_SECOND > self.crossfade:
+            return data
+        with self._lock:
+            upcoming, buffer, buffered = self.upcoming, self._buffer, self._buffered
+        if upcoming is None or not buffered.is_set():
+            return data
+        if self.current.is_opus() or upcoming.is_opus():
+            return data
+        try:
+            incoming = self._take(upcoming, buffer)
+        except Exception:
+            # Discarded mid-fade
+            return data
+        if not incoming:
+            return data
+
+        # Linear fade over the current track's remaining frames
+        fade = left * FRAMES_PER_SECOND / self.crossfade
+        data = data.ljust(FRAME_BYTES, b"\0")[:FRAME_BYTES]
+        incoming = incoming.ljust(FRAME_BYTES, b"\0")[:FRAME_BYTES]
+        return audioop.add(
+            audioop.mul(data, 2, fade), audioop.mul(incoming, 2, 1 - fade), 2
+        )
+
+    def is_opus(self):
+        return self.current.is_opus()
+
+    def cleanup(self):
+        self.discard_upcoming()
+        self.current.cleanup()
@@ -0,0 +1,206 @@
+import os
+import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.audio.tracklist import TrackList
+
+# Operations recorded within this many seconds are written with one fsync
+FLUSH_WINDOW = 0.25
+# Rewrite the snapshot and truncate the journal after this many operations
+COMPACT_EVERY = 5000
+
+
+class QueueJournal:
+    """Per-guild song queues persisted as a snapshot plus an operation log.
+
+    Every change goes through ``record``, which applies it in memory and
+    buffers one JSON line. Buffered lines are appended and fsynced on a
+    writer thread once per ``FLUSH_WINDOW``. On startup the snapshot is
+    loaded and the journal replayed with the same ``_apply`` used live, so
+    the recovered queues are exactly what was last flushed.
+    """
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.journal_path = os.path.join(directory, "queue.journal")
+        self.snapshot_path = os.path.join(directory, "queue.snapshot.json")
+
+        self.queues = {}
+        self._seq = 0
+        self._pending = []
+        self._since_compaction = 0
+        self._flush_handle = None
+        self._writer = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="queue-journal"
+        )
+
+        self._recover()
+
+    def _recover(self):
+        snapshot_seq = 0
+        try:
+            with open(self.snapshot_path, "r") as f:
+                snapshot = json.load(f)
+            snapshot_seq = snapshot["seq"]
+            for guild_id, saved in snapshot["queues"].items():
+                self.queues[int(guild_id)] = self._load_queue(saved)
+        except FileNotFoundError:
+            pass
+        except (json.JSONDecodeError, KeyError):
+            print(f"Ignoring corrupted queue snapshot {self.snapshot_path}")
+
+        self._seq = snapshot_seq
+        replayed = 0
+        try:
+            with open(self.journal_path, "r") as f:
+                for line in f:
+                    try:
+                        op = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Torn write from a crash; nothing after it was synced
+                        break
+                    if op["seq"] <= snapshot_seq:
+                        # Already part of the snapshot (crashed mid-compaction)
+                        continue
+                    self._apply(op)
+                    self._seq = op["seq"]
+                    replayed += 1
+        except FileNotFoundError:
+            pass
+
+        if replayed:
+            print(f"Replayed {replayed} queue operations from {self.journal_path}")
+        # Start each run from a fresh snapshot and an empty journal. Queued on
+        # the writer thread, ahead of any append, so startup doesn't wait on it
+        self._writer.submit(self._compact, self._snapshot())
+
+    @staticmethod
+    def _load_queue(saved):
+        if isinstance(saved, list):
+            # Snapshots from before entry IDs: plain [url, user_id] pairs
+            saved = {"next_id": 1, "items": [[None, *item] for item in saved]}
+        queue = TrackList(saved["next_id"])
+        for entry_id, url, user_id in saved["items"]:
+            queue.append(url, user_id, entry_id)
+        return queue
+
+    def queue(self, guild_id):
+        queue = self.queues.get(guild_id)
+        if queue is None:
+            queue = self.queues[guild_id] = TrackList()
+        return queue
+
+    def _apply(self, op):
+        queue = self.queue(op["g"])
+        kind = op["op"]
+        if kind == "push":
+            for url, user_id in op["items"]:
+                queue.append(url, user_id)
+        elif kind == "pop":
+            return queue.popleft()
+        elif kind == "clear":
+            queue.clear()
+        elif kind == "insert":
+            for offset, (url, user_id) in enumerate(op["items"]):
+                queue.insert(op["index"] + offset, url, user_id)
+        elif kind == "remove":
+            return queue.remove(op["id"])
+        elif kind == "move":
+            return queue.move(op["id"], op["index"])
+        elif kind == "drop":
+            queue.drop_front(op["count"])
+        elif kind == "shuffle":
+            # Seeded, so replaying the journal gives the same order
+            queue.shuffle(op["seed"])
+        else:
+            raise ValueError(f"Unknown queue operation {kind!r}")
+
+    def record(self, guild_id, kind, **args):
+        self._seq += 1
+        op = dict(args, seq=self._seq, g=guild_id, op=kind)
+        result = self._apply(op)
+        self._pending.append(json.dumps(op))
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(
+                FLUSH_WINDOW, self.flush
+            )
+        return result
+
+    def push(self, guild_id, items):
+        self.record(guild_id, "push", items=[list(item) for item in items])
+
+    def pop(self, guild_id):
+        return self.record(guild_id, "pop")
+
+    def clear(self, guild_id):
+        self.record(guild_id, "clear")
+
+    def insert(self, guild_id, index, items):
+        self.record(
+            guild_id, "insert", index=index, items=[list(item) for item in items]
+        )
+
+    def remove(self, guild_id, entry_id):
+        return self.record(guild_id, "remove", id=entry_id)
+
+    def move(self, guild_id, entry_id, index):
+        return self.record(guild_id, "move", id=entry_id, index=index)
+
+    def drop(self, guild_id, count):
+        self.record(guild_id, "drop", count=count)
+
+    def shuffle(self, guild_id, seed):
+        self.record(guild_id, "shuffle", seed=seed)
+
+    def flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending:
+            return None
+
+        lines, self._pending = self._pending, []
+        self._since_compaction += len(lines)
+        if self._since_compaction >= COMPACT_EVERY:
+            # The snapshot already contains these operations
+            self._since_compaction = 0
+            return self._writer.submit(self._compact, self._snapshot())
+        return self._writer.submit(self._append, lines)
+
+    def _snapshot(self):
+        # Empty queues are dropped here; queue() recreates them on demand
+        for guild_id in [gid for gid, queue in self.queues.items() if not queue]:
+            del self.queues[guild_id]
+        return {
+            "seq": self._seq,
+            "queues": {
+                str(guild_id): {
+                    "next_id": queue.next_id,
+                    "items": [list(entry) for entry in queue],
+                }
+                for guild_id, queue in self.queues.items()
+            },
+        }
+
+    def _append(self, lines):
+        with open(self.journal_path, "a") as f:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _compact(self, snapshot):
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(snapshot, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        with open(self.journal_path, "w") as f:
+            os.fsync(f.fileno())
+
+    def close(self):
+        future = self.flush()
+        if future is not None:
+            future.result()
+        self._writer.shutdown(wait=True)
@@ -0,0 +1,612 @@
+import os
+import json
+import sqlite3
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.audio.urls import canonical_url, video_id
+
+# Column name -> SQL type. New columns are added to existing databases on open.
+COLUMNS = {
+    "url": "TEXT PRIMARY KEY",
+    "video_id": "TEXT",
+    "title": "TEXT NOT NULL DEFAULT ''",
+    "filepath": "TEXT NOT NULL DEFAULT ''",
+    "codec": "TEXT",
+    "duration": "INTEGER",
+    "thumbnail": "TEXT",
+    # Cache bookkeeping: file size in bytes, last play (epoch seconds), plays
+    "size": "INTEGER",
+    "last_access": "REAL",
+    "hits": "INTEGER NOT NULL DEFAULT 0",
+    # When ffprobe last confirmed the file is present and playable
+    "verified_at": "REAL",
+    # EBU R128 integrated loudness (LUFS) and the playback gain (dB) it needs;
+    # gain stays NULL until the file has been analysed
+    "loudness": "REAL",
+    "gain": "REAL",
+    # 1 once the file itself has been re-encoded with that gain
+    "gain_applied": "INTEGER NOT NULL DEFAULT 0",
+}
+
+# Each play keeps a track around as if it had been played this much later.
+# Eviction goes by this expression and it is indexed as is, so changing the
+# bonus means renaming the index.
+HIT_BONUS = 24 * 60 * 60
+COLDNESS = f"COALESCE(last_access, 0) + {HIT_BONUS} * hits"
+
+INDEXES = {
+    "searches_resolved_at": "searches (resolved_at)",
+    "tracks_coldness": f"tracks ({COLDNESS})",
+    "tracks_filepath": "tracks (filepath)",
+    "tracks_verified_at": "tracks (verified_at)",
+    "tracks_gain": "tracks (gain)",
+    "failures_failed_at": "failures (failed_at)",
+}
+# Indexes older versions created that nothing queries any more; they only
+# slowed down writes
+DROPPED_INDEXES = ("tracks_video_id", "tracks_title", "tracks_last_access")
+
+
+def log_write_error(future):
+    # Done-callback for writes nobody awaits, so a failure isn't lost
+    if not future.cancelled() and future.exception() is not None:
+        print(f"Library write failed: {future.exception()!r}")
+
+
+class Library:
+    """SQLite-backed song library.
+
+    Lookups are plain indexed SELECTs on the calling thread. Writes go to a
+    single writer thread with its own connection, so the event loop never
+    waits on a commit; ``put`` and ``remove`` return awaitables. Callers
+    that don't await one attach ``log_write_error`` instead.
+
+    ``index`` maps URLs to files known to be good (verified, or committed by
+    this process), so cache hits on those need neither SQL nor a stat().
+    It starts empty and is filled by ``load_index``.
+    """
+
+    def __init__(self, path, legacy_json=None):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        self._db = self._connect()
+        self._create_schema()
+        if legacy_json and os.path.exists(legacy_json):
+            self._migrate_json(legacy_json)
+        self._merge_duplicates()
+
+        self.index = {}
+        # URLs dropped from the index while an index update was in flight
+        self._unindexed = None
+        self._index_updates = 0
+
+        self._writer_db = None
+        self._writer = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="library-writer",
+            initializer=self._open_writer,
+        )
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        db.row_factory = sqlite3.Row
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def _open_writer(self):
+        self._writer_db = self._connect()
+
+    def _create_schema(self):
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS tracks ("
+                + ", ".join(f"{name} {kind}" for name, kind in COLUMNS.items())
+                + ")"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS searches ("
+                "query TEXT PRIMARY KEY, url TEXT NOT NULL, resolved_at REAL NOT NULL)"
+            )
+            # Tracks queued or playing in each bot process, which none of
+            # them may evict
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS pins ("
+                "owner INTEGER NOT NULL, url TEXT NOT NULL, "
+                "updated_at REAL NOT NULL, PRIMARY KEY (owner, url))"
+            )
+            # URLs that failed permanently (deleted, private, region locked)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS failures ("
+                "url TEXT PRIMARY KEY, reason TEXT NOT NULL, failed_at REAL NOT NULL)"
+            )
+            existing = {
+                row["name"] for row in self._db.execute("PRAGMA table_info(tracks)")
+            }
+            for name, kind in COLUMNS.items():
+                if name not in existing:
+                    self._db.execute(f"ALTER TABLE tracks ADD COLUMN {name} {kind}")
+            for name, target in INDEXES.items():
+                self._db.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+            for name in DROPPED_INDEXES:
+                self._db.execute(f"DROP INDEX IF EXISTS {name}")
+
+    def _migrate_json(self, legacy_json):
+        try:
+            with open(legacy_json, "r") as f:
+                entries = json.load(f)
+        except json.JSONDecodeError:
+            print(f"Skipping migration of corrupted library file {legacy_json}")
+            return
+
+        rows = []
+        for url, entry in entries.items():
+            row = dict(entry, url=url)
+            row.setdefault("video_id", video_id(url))
+            rows.append(self._row(row))
+
+        with self._db:
+            self._db.executemany(self._upsert_sql(), rows)
+        os.replace(legacy_json, legacy_json + ".migrated")
+        print(f"Migrated {len(rows)} library entries from {legacy_json}")
+
+    def _merge_duplicates(self):
+        """One-off merge of entries whose URLs point at the same video."""
+        if self._db.execute("PRAGMA user_version").fetchone()[0] >= 1:
+            return
+
+        groups = {}
+        for row in self._db.execute("SELECT * FROM tracks"):
+            entry = self._entry(row)
+            groups.setdefault(canonical_url(entry["url"]), []).append(entry)
+
+        merged = 0
+        orphaned = []
+        with self._db:
+            for url, group in groups.items():
+                # Keep an entry whose file is still there, canonical one first
+                group.sort(
+                    key=lambda entry: (
+                        not os.path.exists(entry.get("filepath", "")),
+                        entry["url"] != url,
+                    )
+                )
+                keep = dict(group[0], url=url)
+                keep["video_id"] = video_id(url) or keep.get("video_id")
+                if len(group) == 1 and group[0] == keep:
+                    continue
+
+                self._db.executemany(
+                    "DELETE FROM tracks WHERE url = ?",
+                    [(entry["url"],) for entry in group],
+                )
+                self._db.execute(self._upsert_sql(), self._row(keep))
+                merged += len(group) - 1
+                orphaned.extend(
+                    entry["filepath"]
+                    for entry in group[1:]
+                    if entry.get("filepath") and entry["filepath"] != keep["filepath"]
+                )
+            self._db.execute("PRAGMA user_version = 1")
+
+        # Title-based filenames can be shared, only delete files nobody uses
+        in_use = {row[0] for row in self._db.execute("SELECT filepath FROM tracks")}
+        reclaimed = 0
+        for path in set(orphaned) - in_use:
+            if os.path.exists(path):
+                reclaimed += os.path.getsize(path)
+                os.remove(path)
+        if merged:
+            print(
+                f"Merged {merged} duplicate library entries, "
+                f"reclaimed {reclaimed / 1024 / 1024:.1f} MiB"
+            )
+
+    @staticmethod
+    def _row(entry):
+        row = {name: entry.get(name) for name in COLUMNS}
+        row["hits"] = row["hits"] or 0
+        row["gain_applied"] = row["gain_applied"] or 0
+        return row
+
+    @staticmethod
+    def _upsert_sql():
+        names = ", ".join(COLUMNS)
+        params = ", ".join(f":{name}" for name in COLUMNS)
+        return f"INSERT OR REPLACE INTO tracks ({names}) VALUES ({params})"
+
+    @staticmethod
+    def _entry(row):
+        return {key: row[key] for key in row.keys() if row[key] is not None}
+
+    # In-memory index
+
+    def indexed_path(self, url):
+        return self.index.get(url)
+
+    def forget(self, url):
+        # Indexed file that turned out to be gone, e.g. evicted by another process
+        self._unindex(url)
+
+    def _unindex(self, url):
+        self.index.pop(url, None)
+        if self._unindexed is not None:
+            self._unindexed.add(url)
+
+    def _begin_index_update(self):
+        if self._index_updates == 0:
+            self._unindexed = set()
+        self._index_updates += 1
+
+    def _end_index_update(self):
+        self._index_updates -= 1
+        if self._index_updates == 0:
+            self._unindexed = None
+
+    async def load_index(self):
+        self._begin_index_update()
+        try:
+            loaded = await self._submit(self._fetch_index)
+            # Drop anything removed while the query ran, keep anything added
+            for url in self._unindexed:
+                loaded.pop(url, None)
+            loaded.update(self.index)
+            self.index = loaded
+        finally:
+            self._end_index_update()
+        return len(loaded)
+
+    def _fetch_index(self):
+        rows = self._writer_db.execute(
+            "SELECT url, filepath FROM tracks WHERE verified_at IS NOT NULL"
+        )
+        return dict(rows.fetchall())
+
+    # Reads
+
+    def get(self, url, default=None):
+        row = self._db.execute("SELECT * FROM tracks WHERE url = ?", (url,)).fetchone()
+        return self._entry(row) if row else default
+
+    def __getitem__(self, url):
+        entry = self.get(url)
+        if entry is None:
+            raise KeyError(url)
+        return entry
+
+    def __contains__(self, url):
+        return (
+            self._db.execute("SELECT 1 FROM tracks WHERE url = ?", (url,)).fetchone()
+            is not None
+        )
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+
+    def get_search(self, query):
+        row = self._db.execute(
+            "SELECT url, resolved_at FROM searches WHERE query = ?", (query,)
+        ).fetchone()
+        return (row["url"], row["resolved_at"]) if row else None
+
+    def get_failure(self, url):
+        row = self._db.execute(
+            "SELECT reason, failed_at FROM failures WHERE url = ?", (url,)
+        ).fetchone()
+        return (row["reason"], row["failed_at"]) if row else None
+
+    def unverified(self, before, limit=100):
+        rows = self._db.execute(
+            "SELECT url, filepath FROM tracks "
+            "WHERE verified_at IS NULL OR verified_at < ? LIMIT ?",
+            (before, limit),
+        )
+        return [tuple(row) for row in rows]
+
+    def unanalyzed(self, limit=100):
+        rows = self._db.execute(
+            "SELECT url, filepath, video_id FROM tracks "
+            "WHERE gain IS NULL AND filepath != '' LIMIT ?",
+            (limit,),
+        )
+        return [tuple(row) for row in rows]
+
+    def unnormalized(self, tolerance, limit=100):
+        """Analysed tracks whose file still needs a gain of ``tolerance`` dB
+        or more applied, as (url, filepath, video_id, loudness, gain)."""
+        rows = self._db.execute(
+            "SELECT url, filepath, video_id, loudness, gain FROM tracks "
+            "WHERE (gain >= ? OR gain <= ?) AND NOT gain_applied "
+            "AND filepath != '' LIMIT ?",
+            (tolerance, -tolerance, limit),
+        )
+        return [tuple(row) for row in rows]
+
+    # Reads that scan or sum the whole table, or look up many rows at once;
+    # these run on the writer thread like writes and return awaitables
+
+    def durations(self, urls):
+        """Known durations of ``urls``, as url -> seconds."""
+        return self._submit(self._durations, list(urls))
+
+    def _durations(self, urls):
+        durations = {}
+        # SQLite limits how many parameters one statement may have
+        for start in range(0, len(urls), 500):
+            chunk = urls[start : start + 500]
+            rows = self._writer_db.execute(
+                "SELECT url, duration FROM tracks WHERE duration IS NOT NULL "
+                f"AND url IN ({', '.join('?' * len(chunk))})",
+                chunk,
+            )
+            durations.update(rows.fetchall())
+        return durations
+
+    def total_size(self):
+        return self._submit(self._total_size)
+
+    def _total_size(self):
+        return self._writer_db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM tracks"
+        ).fetchone()[0]
+
+    def eviction_candidates(self, limit=500):
+        """Coldest tracks first: least recently played, where every play
+        counts as HIT_BONUS seconds of extra recency."""
+        return self._submit(self._eviction_candidates, limit)
+
+    def _eviction_candidates(self, limit):
+        rows = self._writer_db.execute(
+            f"SELECT url, filepath, size FROM tracks ORDER BY {COLDNESS} LIMIT ?",
+            (limit,),
+        )
+        return [tuple(row) for row in rows]
+
+    def pinned_urls(self, since):
+        return self._submit(self._pinned_urls, since)
+
+    def _pinned_urls(self, since):
+        rows = self._writer_db.execute(
+            "SELECT DISTINCT url FROM pins WHERE updated_at >= ?", (since,)
+        )
+        return {row[0] for row in rows}
+
+    # Writes
+
+    def _submit(self, fn, *args):
+        return asyncio.wrap_future(self._writer.submit(fn, *args))
+
+    def put(self, url, entry):
+        row = self._row(dict(entry, url=url))
+        if row["verified_at"] is not None:
+            self.index[url] = row["filepath"]
+        else:
+            self._unindex(url)
+        return self._submit(self._put, row)
+
+    def _put(self, row):
+        with self._writer_db:
+            self._writer_db.execute(self._upsert_sql(), row)
+
+    def remove(self, url):
+        self._unindex(url)
+        return self._submit(self._remove, url)
+
+    def _remove(self, url):
+        with self._writer_db:
+            self._writer_db.execute("DELETE FROM tracks WHERE url = ?", (url,))
+
+    def put_search(self, query, url, resolved_at):
+        return self._submit(self._put_search, query, url, resolved_at)
+
+    def _put_search(self, query, url, resolved_at):
+        with self._writer_db:
+            self._writer_db.execute(
+                "INSERT OR REPLACE INTO searches (query, url, resolved_at) "
+                "VALUES (?, ?, ?)",
+                (query, url, resolved_at),
+            )
+
+    def prune_searches(self, before):
+        return self._submit(self._prune_searches, before)
+
+    def _prune_searches(self, before):
+        with self._writer_db:
+            self._writer_db.execute(
+                "DELETE FROM searches WHERE resolved_at < ?", (before,)
+            )
+
+    def put_failure(self, url, reason, failed_at):
+        return self._submit(self._put_failure, url, reason, failed_at)
+
+    def _put_failure(self, url, reason, failed_at):
+        with self._writer_db:
+            self._writer_db.execute(
+                "INSERT OR REPLACE INTO failures (url, reason, failed_at) "
+                "VALUES (?, ?, ?)",
+                (url, reason, failed_at),
+            )
+
+    def prune_failures(self, before):
+        return self._submit(self._prune_failures, before)
+
+    def _prune_failures(self, before):
+        with self._writer_db:
+            self._writer_db.execute(
+                "DELETE FROM failures WHERE failed_at < ?", (before,)
+            )
+
+    def put_pins(self, owner, urls, updated_at):
+        """Replace the tracks pinned by ``owner`` with ``urls``."""
+        return self._submit(self._put_pins, owner, list(urls), updated_at)
+
+    def _put_pins(self, owner, urls, updated_at):
+        with self._writer_db:
+            self._writer_db.execute("DELETE FROM pins WHERE owner = ?", (owner,))
+            self._writer_db.executemany(
+                "INSERT OR IGNORE INTO pins (owner, url, updated_at) "
+                "VALUES (?, ?, ?)",
+                [(owner, url, updated_at) for url in urls],
+            )
+
+    def touch_many(self, touches):
+        """Record plays, ``touches`` maps url -> (play count, last played)."""
+        return self._submit(self._touch_many, list(touches.items()))
+
+    def _touch_many(self, touches):
+        with self._writer_db:
+            self._writer_db.executemany(
+                "UPDATE tracks SET hits = hits + ?, last_access = ? WHERE url = ?",
+                [(count, when, url) for url, (count, when) in touches],
+            )
+
+    def backfill_sizes(self):
+        return self._submit(self._backfill_sizes)
+
+    def _backfill_sizes(self):
+        rows = self._writer_db.execute(
+            "SELECT url, filepath FROM tracks WHERE size IS NULL"
+        ).fetchall()
+        sizes = []
+        for url, filepath in rows:
+            try:
+                sizes.append((os.path.getsize(filepath), url))
+            except OSError:
+                sizes.append((0, url))
+        with self._writer_db:
+            self._writer_db.executemany(
+                "UPDATE tracks SET size = ? WHERE url = ?", sizes
+            )
+        return len(sizes)
+
+    def evict(self, urls):
+        urls = list(urls)
+        for url in urls:
+            self._unindex(url)
+        return self._submit(self._evict, urls)
+
+    def _evict(self, urls):
+        # Drop the rows first so nothing new can be served from these files,
+        # then delete files that no remaining entry refers to
+        with self._writer_db:
+            paths = {
+                row[0]
+                for url in urls
+                for row in self._writer_db.execute(
+                    "SELECT filepath FROM tracks WHERE url = ?", (url,)
+                )
+            }
+            self._writer_db.executemany(
+                "DELETE FROM tracks WHERE url = ?", [(url,) for url in urls]
+            )
+            still_used = {
+                path
+                for path in paths
+                if self._writer_db.execute(
+                    "SELECT 1 FROM tracks WHERE filepath = ? LIMIT 1", (path,)
+                ).fetchone()
+            }
+
+        freed = 0
+        for path in paths - still_used:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                freed += size
+            except OSError:
+                pass
+        return freed
+
+    async def record_verified(self, results):
+        """Store ffprobe results, ``results`` is a list of
+        (url, filepath, size, duration, verified_at)."""
+        self._begin_index_update()
+        try:
+            updated = await self._submit(self._record_verified, results)
+            for url, filepath in updated:
+                if url not in self._unindexed:
+                    self.index[url] = filepath
+        finally:
+            self._end_index_update()
+
+    def _record_verified(self, results):
+        updated = []
+        with self._writer_db:
+            for url, filepath, size, duration, verified_at in results:
+                # Rows removed or replaced since they were probed are skipped
+                cursor = self._writer_db.execute(
+                    "UPDATE tracks SET size = ?, duration = COALESCE(?, duration), "
+                    "verified_at = ? WHERE url = ? AND filepath = ?",
+                    (size, duration, verified_at, url, filepath),
+                )
+                if cursor.rowcount:
+                    updated.append((url, filepath))
+        return updated
+
+    def record_loudness(self, results):
+        """Store loudness analysis, ``results`` is a list of
+        (url, filepath, loudness, gain)."""
+        return self._submit(self._record_loudness, results)
+
+    def _record_loudness(self, results):
+        with self._writer_db:
+            self._writer_db.executemany(
+                "UPDATE tracks SET loudness = ?, gain = ? "
+                "WHERE url = ? AND filepath = ?",
+                [
+                    (loudness, gain, url, filepath)
+                    for url, filepath, loudness, gain in results
+                ],
+            )
+
+    async def record_normalized(self, results):
+        """Point tracks at their gain-adjusted files, ``results`` is a list of
+        (url, old filepath, new filepath, size, loudness, gain)."""
+        self._begin_index_update()
+        try:
+            updated = await self._submit(self._record_normalized, results)
+            for url, filepath in updated:
+                if url not in self._unindexed:
+                    self.index[url] = filepath
+        finally:
+            self._end_index_update()
+
+    def _record_normalized(self, results):
+        updated = []
+        unused = []
+        with self._writer_db:
+            for url, old_path, new_path, size, loudness, gain in results:
+                cursor = self._writer_db.execute(
+                    "UPDATE tracks SET filepath = ?, codec = 'opus', size = ?, "
+                    "loudness = ?, gain = ?, gain_applied = 1 "
+                    "WHERE url = ? AND filepath = ?",
+                    (new_path, size, loudness, gain, url, old_path),
+                )
+                if not cursor.rowcount:
+                    unused.append(new_path)
+                    continue
+                updated.append((url, new_path))
+                if not self._writer_db.execute(
+                    "SELECT 1 FROM tracks WHERE filepath = ? LIMIT 1", (old_path,)
+                ).fetchone():
+                    unused.append(old_path)
+
+        # Replaced files, and new ones for tracks removed or replaced since
+        for path in unused:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return updated
+
+    def close(self):
+        # The writer connection belongs to the writer thread, close it there
+        self._writer.submit(self._close_writer).result()
+        self._writer.shutdown(wait=True)
+        self._db.close()
+
+    def _close_writer(self):
+        self._writer_db.close()
+        self._writer_db = None
@@ -0,0 +1,74 @@
+import os
+import fcntl
+
+
+class FileLock:
+    """Exclusive flock() on a file, shared by every process of the bot.
+
+    The lock belongs to the open file, so it goes away with the process
+    holding it; a worker that crashes can't leave it held. Acquiring a lock
+    this object already holds succeeds straight away.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    @property
+    def held(self):
+        return self._fd is not None
+
+    def acquire(self):
+        # Never blocks; False if another process holds the lock
+        if self._fd is not None:
+            return True
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is None:
+            return
+        fd, self._fd = self._fd, None
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+class RangeLocks:
+    """Any number of exclusive locks in one file, as fcntl byte-range locks.
+
+    Lock ``n`` is byte ``n`` of the file, so there is one file however many
+    keys get locked, and it never has to be removed. Like flock(), they go
+    away with the process holding them. POSIX record locks belong to the
+    process, though: they never conflict within it, and closing any
+    descriptor of the file drops all of them, so everything goes through
+    the one descriptor kept here. Callers keep their own tasks apart.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def acquire(self, n):
+        # Never blocks; False if another process holds lock n
+        if self._fd is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, n)
+        except (BlockingIOError, PermissionError):
+            return False
+        return True
+
+    def release(self, n):
+        if self._fd is not None:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, n)
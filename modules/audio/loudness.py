@@ -0,0 +1,66 @@
+import re
+import subprocess
+import contextlib
+
+# Integrated loudness every track is brought to (LUFS), and the true peak
+# (dBTP) a positive gain may not push it past
+TARGET_LOUDNESS = -14.0
+MAX_TRUE_PEAK = -1.0
+# Never turn anything up or down by more than this (dB)
+MAX_GAIN = 12.0
+# ebur128 reports this for silence
+SILENCE = -70.0
+
+INTEGRATED = re.compile(r"I:\s+(-?[\d.]+) LUFS")
+TRUE_PEAK = re.compile(r"Peak:\s+(-?[\d.]+|-inf) dBFS")
+
+
+def gain_for(loudness, peak):
+    """Gain in dB that brings ``loudness`` to the target without clipping."""
+    if loudness <= SILENCE:
+        return 0.0
+    gain = TARGET_LOUDNESS - loudness
+    if gain > 0:
+        # Turning up stops where the peaks would start to clip
+        gain = max(0.0, min(gain, MAX_TRUE_PEAK - peak))
+    return round(max(-MAX_GAIN, min(MAX_GAIN, gain)), 1)
+
+
+def analyze(filepath, scheduler=None):
+    """EBU R128 pass over ``filepath``: (integrated LUFS, gain dB) or None.
+
+    Decodes the whole file once through FFmpeg's ebur128 filter, holding
+    one of the scheduler's FFmpeg slots if given one. None means FFmpeg ran
+    but could not measure the file; failing to run FFmpeg at all raises.
+    """
+    slot = scheduler.ffmpeg_slot() if scheduler else contextlib.nullcontext()
+    with slot:
+        result = subprocess.run(
+            [
+                "ffmpeg",
+                "-hide_banner",
+                "-nostats",
+                "-i",
+                filepath,
+                "-map",
+                "0:a:0",
+                "-af",
+                "ebur128=peak=true:framelog=quiet",
+                "-f",
+                "null",
+                "-",
+            ],
+            capture_output=True,
+            timeout=600,
+        )
+    if result.returncode != 0:
+        return None
+
+    output = result.stderr.decode(errors="replace")
+    summary = output[output.rfind("Summary:") :]
+    loudness = INTEGRATED.search(summary)
+    peak = TRUE_PEAK.search(summary)
+    if loudness is None or peak is None:
+        return None
+    loudness = float(loudness.group(1))
+    return loudness, gain_for(loudness, float(peak.group(1)))
@@ -0,0 +1,275 @@
+import sys
+import time
+import asyncio
+import threading
+import traceback
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from aiohttp import web
+
+# Upper bounds, in seconds, of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _series_name(name, key, extra=()):
+    labels = key + tuple(extra)
+    if not labels:
+        return name
+    rendered = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+        for k, v in labels
+    )
+    return f"{name}{{{rendered}}}"
+
+
+class Counter:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_key(labels), 0)
+
+    def total(self):
+        return sum(self._values.values())
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for key, value in list(self._values.items()):
+            yield f"{_series_name(self.name, key)} {value}"
+
+
+class Histogram:
+    """Bucketed observations, optionally split by labels.
+
+    Safe to observe from worker threads; quantiles are estimated from the
+    bucket bounds, which is as precise as /stats needs.
+    """
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # One count per bucket plus +Inf, then the running sum
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def labels(self):
+        return [dict(key) for key in list(self._series)]
+
+    def count(self, **labels):
+        series = self._series.get(_key(labels))
+        return sum(series[:-1]) if series else 0
+
+    def quantile(self, q, **labels):
+        """Upper bound of the bucket holding the ``q`` quantile, or None."""
+        series = self._series.get(_key(labels))
+        if not series:
+            return None
+        target = q * sum(series[:-1])
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), series):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for key, series in list(self._series.items()):
+            series = list(series)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                name = _series_name(f"{self.name}_bucket", key, [("le", bound)])
+                yield f"{name} {cumulative}"
+            yield f"{_series_name(self.name + '_sum', key)} {series[-1]}"
+            yield f"{_series_name(self.name + '_count', key)} {cumulative}"
+
+
+class Metrics:
+    """Named counters, histograms and gauges, rendered for Prometheus.
+
+    Gauges are callbacks read at scrape time, so nothing has to keep them
+    up to date in between.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._gauges = {}
+
+    def counter(self, name, help):
+        if name not in self._metrics:
+            self._metrics[name] = Counter(name, help)
+        return self._metrics[name]
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS):
+        if name not in self._metrics:
+            self._metrics[name] = Histogram(name, help, buckets)
+        return self._metrics[name]
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def gauge(self, name, help, read):
+        self._gauges[name] = (help, read)
+
+    def remove_gauge(self, name):
+        self._gauges.pop(name, None)
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        for name, (help, read) in list(self._gauges.items()):
+            try:
+                value = read()
+            except Exception as e:
+                print(f"Reading gauge {name} failed: {e}")
+                continue
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# Shared by every cog, whichever order they are loaded in
+metrics = Metrics()
+
+
+class LoopMonitor:
+    """Measures event loop lag and reports callbacks that block it.
+
+    A task sleeps ``interval`` seconds at a time and records how late it
+    woke up. Separately, a watchdog thread keeps scheduling a no-op on the
+    loop; when one hasn't run after ``threshold`` seconds, it prints the
+    loop thread's current stack, which names the code that is blocking.
+    """
+
+    def __init__(self, interval=0.5, threshold=0.25):
+        self.interval = interval
+        self.threshold = threshold
+        self.lag = metrics.histogram(
+            "event_loop_lag_seconds", "How late the loop woke up a sleeping task"
+        )
+        self.stalls = metrics.counter(
+            "event_loop_stalls_total", "Times the loop was blocked past the threshold"
+        )
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+        self._task = None
+        self._thread = None
+        self._stopped = threading.Event()
+        self._ping_sent = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._ping_sent = None
+        self._stopped.clear()
+        self._task = self._loop.create_task(self.sample())
+        self._thread = threading.Thread(
+            target=self.watch, name="loop-watchdog", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    async def sample(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - started - self.interval)
+            self.lag.observe(lag)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+
+    def _pong(self):
+        self._ping_sent = None
+
+    def watch(self):
+        reported = False
+        while not self._stopped.wait(self.threshold / 4):
+            sent = self._ping_sent
+            if sent is None:
+                self._ping_sent = time.monotonic()
+                reported = False
+                try:
+                    self._loop.call_soon_threadsafe(self._pong)
+                except RuntimeError:
+                    # Loop closed
+                    return
+                continue
+
+            blocked = time.monotonic() - sent
+            if reported or blocked < self.threshold:
+                continue
+            # Once per stall, while it is still going on
+            reported = True
+            self.stalls.inc()
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = "".join(traceback.format_stack(frame)) if frame else ""
+            print(f"Event loop blocked for over {blocked:.2f}s at:\n{stack}")
+
+
+class MetricsServer:
+    """Serves ``metrics`` in the Prometheus text format on ``/metrics``."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self._runner = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        print(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def handle(self, request):
+        return web.Response(
+            body=metrics.render().encode(),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,276 @@
+import random
+import asyncio
+
+from modules.audio.playlist import is_cursor
+from modules.audio.scheduler import NOW_PLAYING
+
+# Seconds a player may sit with nothing to play before it is torn down
+IDLE_TIMEOUT = 300
+
+# How long before the current track ends the next one is opened, so it can
+# follow without a gap; keep it longer than any crossfade
+PREPARE_AHEAD = 10
+
+
+async def wait_any(events, timeout=None):
+    waiters = [asyncio.ensure_future(event.wait()) for event in events]
+    try:
+        await asyncio.wait(
+            waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+        )
+    finally:
+        for waiter in waiters:
+            waiter.cancel()
+
+
+class GuildPlayer:
+    """Queue, now-playing state and playback task for a single guild."""
+
+    def __init__(self, registry, guild, channel):
+        self.registry = registry
+        self.journal = registry.journal
+        self.cog = registry.cog
+        self.bot = registry.cog.bot
+        self.guild = guild
+        self.channel = channel
+
+        self.current_song = None
+        self.current_url = None
+        self.is_playing = False
+        # TrackChain given to the voice client, and the queue entry (with
+        # where its audio comes from and its source) prepared behind it
+        self.chain = None
+        self.prepared = None
+
+        self._wakeup = asyncio.Event()
+        self._next = asyncio.Event()
+        self._advanced = asyncio.Event()
+        self.task = self.bot.loop.create_task(self.player_loop())
+
+    @property
+    def queue(self):
+        return self.journal.queue(self.guild.id)
+
+    def enqueue(self, url, user_id):
+        self.journal.push(self.guild.id, [(url, user_id)])
+        info = self.cog.track_info(url)
+        if info:
+            self.queue.learn_duration(url, info.get("duration"))
+        self._wakeup.set()
+
+    def enqueue_playlist(self, songs, next_cursor, user_id, index=None):
+        # One window of playlist songs, followed by the cursor for the rest
+        items = [(url, user_id) for url, _ in songs]
+        if next_cursor is not None:
+            items.append((next_cursor, user_id))
+        if index is None:
+            self.journal.push(self.guild.id, items)
+        else:
+            self.journal.insert(self.guild.id, index, items)
+            self.queue_changed()
+        for url, duration in songs:
+            self.queue.learn_duration(url, duration)
+        self._wakeup.set()
+
+    async def expand_front(self):
+        # Swap a playlist cursor at the front for its next window of songs
+        while self.queue and is_cursor(self.queue[0].url):
+            cursor = self.queue[0]
+            try:
+                songs, next_cursor = await self.cog.read_playlist(
+                    self.guild.id, cursor.url, priority=NOW_PLAYING
+                )
+            except Exception as e:
+                print(f"Failed to read playlist {cursor.url}: {e}")
+                await self.channel.send(f"⚠️ Couldn't load more of the playlist: {e}")
+                songs, next_cursor = [], None
+
+            try:
+                index = self.queue.index_of(cursor.id)
+            except KeyError:
+                # Removed or cleared while it was being read
+                continue
+            self.journal.remove(self.guild.id, cursor.id)
+            if songs or next_cursor is not None:
+                self.enqueue_playlist(songs, next_cursor, cursor.user_id, index)
+
+    def clear(self):
+        self.journal.clear(self.guild.id)
+        self.queue_changed()
+
+    def remove(self, index):
+        entry = self.journal.remove(self.guild.id, self.queue[index].id)
+        self.queue_changed()
+        return entry
+
+    def move(self, index, new_index):
+        entry = self.journal.move(self.guild.id, self.queue[index].id, new_index)
+        self.queue_changed()
+        return entry
+
+    def skip_to(self, index):
+        # Drop everything before it; the caller stops the current song
+        self.journal.drop(self.guild.id, index)
+        self.queue_changed()
+
+    def shuffle(self):
+        self.journal.shuffle(self.guild.id, random.getrandbits(32))
+        self.queue_changed()
+
+    def queue_changed(self):
+        # The prepared track has to be the one at the front of the queue
+        if self.prepared is None:
+            return
+        entry = self.prepared[0]
+        if self.queue and self.queue[0].id == entry.id:
+            return
+        # If the chain already moved on to it, it plays and is popped as usual
+        if self.chain.discard_upcoming():
+            self.prepared = None
+            self._wakeup.set()
+
+    def track_finished(self, error):
+        # Called from the voice thread once the current source is exhausted
+        if error is not None:
+            print(f"Player error: {error}")
+        self.bot.loop.call_soon_threadsafe(self._next.set)
+
+    def track_advanced(self, source):
+        # Called from the voice thread when the chain moves on to the next track
+        self.bot.loop.call_soon_threadsafe(self._advanced.set)
+
+    async def prepare_next(self):
+        entry = self.queue[0]
+        try:
+            source, origin = await self.cog.open_track(self.guild.id, entry.url)
+        except Exception as e:
+            # Tried again, with the error shown, once the current track ends
+            print(f"Couldn't prepare {entry.url}: {e}")
+            return
+        if self._next.is_set() or not self.queue or self.queue[0].id != entry.id:
+            source.cleanup()
+            return
+        self.prepared = (entry, origin, source)
+        self.chain.prepare(source)
+
+    async def advanced(self):
+        entry, origin, source = self.prepared
+        self.prepared = None
+        try:
+            self.journal.remove(self.guild.id, entry.id)
+        except KeyError:
+            # Removed from the queue just as it started playing
+            pass
+        try:
+            await self.cog.track_started(self, source, entry.url, entry.user_id, origin)
+        except Exception as e:
+            print(f"Error announcing song: {e}")
+
+    async def follow_chain(self):
+        # Keep the next track prepared behind the current one until the chain
+        # runs out, either at the end of the queue or on a skip or stop
+        while not self._next.is_set() or self._advanced.is_set():
+            if self._advanced.is_set():
+                self._advanced.clear()
+                await self.advanced()
+            self._wakeup.clear()
+            # Read ahead while this song plays, not once it has ended
+            await self.expand_front()
+
+            timeout = None
+            left = self.chain.seconds_left()
+            if self.prepared is None and left is not None:
+                if left > PREPARE_AHEAD:
+                    timeout = left - PREPARE_AHEAD
+                elif self.queue:
+                    await self.prepare_next()
+            await wait_any((self._next, self._advanced, self._wakeup), timeout)
+
+        self.chain = None
+        self.prepared = None
+
+    async def player_loop(self):
+        try:
+            while True:
+                self._wakeup.clear()
+                await self.expand_front()
+                if not self.queue:
+                    if self.is_playing:
+                        self.is_playing = False
+                        self.current_song = None
+                        self.current_url = None
+                        await self.channel.send("Queue is empty!")
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), IDLE_TIMEOUT)
+                    except asyncio.TimeoutError:
+                        break
+                    continue
+
+                if self.guild.voice_client is None:
+                    # Nowhere to play; keep the queue until someone reconnects us
+                    self.is_playing = False
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), IDLE_TIMEOUT)
+                    except asyncio.TimeoutError:
+                        break
+                    continue
+
+                self.is_playing = True
+                entry = self.journal.pop(self.guild.id)
+
+                self._next.clear()
+                self._advanced.clear()
+                try:
+                    await self.cog.start_track(self, entry.url, entry.user_id)
+                except Exception as e:
+                    print(f"Error playing song: {e}")
+                    await self.channel.send(f"Error playing song: {str(e)}")
+                    continue
+
+                await self.follow_chain()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Player loop for guild {self.guild.id} crashed: {e}")
+        finally:
+            self.registry.discard(self)
+
+        voice_client = self.guild.voice_client
+        if voice_client is not None and not voice_client.is_playing():
+            await voice_client.disconnect()
+
+
+class PlayerRegistry:
+    """Creates guild players on demand and forgets them once they go idle."""
+
+    def __init__(self, cog, journal):
+        self.cog = cog
+        self.journal = journal
+        self.players = {}
+
+    def __len__(self):
+        return len(self.players)
+
+    def __iter__(self):
+        return iter(list(self.players.values()))
+
+    def get(self, ctx):
+        player = self.players.get(ctx.guild.id)
+        if player is None:
+            player = GuildPlayer(self, ctx.guild, ctx.channel)
+            self.players[ctx.guild.id] = player
+        else:
+            player.channel = ctx.channel
+        return player
+
+    def find(self, guild_id):
+        return self.players.get(guild_id)
+
+    def discard(self, player):
+        if self.players.get(player.guild.id) is player:
+            del self.players[player.guild.id]
+
+    def shutdown(self):
+        for player in list(self.players.values()):
+            player.task.cancel()
+        self.players.clear()
@@ -0,0 +1,97 @@
+import itertools
+from collections import OrderedDict
+
+import yt_dlp as youtube_dl
+
+from modules.audio.urls import canonical_url
+
+# Playlist entries turned into queued songs per expansion
+WINDOW = 50
+# Open playlist iterators kept around for the next window
+OPEN_PLAYLISTS = 32
+
+CURSOR_PREFIX = "playlist:"
+
+
+def cursor_url(playlist_url, start):
+    """Queue entry standing in for a playlist from entry ``start`` onwards."""
+    return f"{CURSOR_PREFIX}{start}:{playlist_url}"
+
+
+def parse_cursor(url):
+    """``(playlist_url, start)`` for a cursor entry, None for a song."""
+    if not url.startswith(CURSOR_PREFIX):
+        return None
+    start, _, playlist_url = url[len(CURSOR_PREFIX) :].partition(":")
+    return playlist_url, int(start)
+
+
+def is_cursor(url):
+    return url.startswith(CURSOR_PREFIX)
+
+
+class PlaylistReader:
+    """Reads playlists one window of flat entries at a time.
+
+    yt-dlp is asked for the playlist without processing it, which gives a
+    lazy iterator over its pages. ``read`` pulls the next ``WINDOW`` entries
+    from it on a worker thread and keeps the iterator under the cursor for
+    the rest, so the next window continues where this one stopped. After a
+    restart, or once an iterator has been dropped, the playlist is reopened
+    and skipped ahead to the cursor's offset.
+    """
+
+    def __init__(self, options):
+        self.options = options
+        self._open = OrderedDict()
+
+    def _open_entries(self, playlist_url):
+        ydl = youtube_dl.YoutubeDL(self.options)
+        info = ydl.extract_info(playlist_url, download=False, process=False)
+        # Watch-page links to a playlist point at the playlist page
+        for _ in range(3):
+            if not info or info.get("_type") not in ("url", "url_transparent"):
+                break
+            info = ydl.extract_info(info["url"], download=False, process=False)
+        if not info or "entries" not in info:
+            return None
+        return iter(info["entries"])
+
+    def _read_window(self, cursor, entries):
+        playlist_url, start = parse_cursor(cursor)
+        if entries is None:
+            entries = self._open_entries(playlist_url)
+            if entries is None:
+                return [], None, None
+            entries = itertools.islice(entries, start, None)
+        window = list(itertools.islice(entries, WINDOW))
+        return window, entries, cursor_url(playlist_url, start + len(window))
+
+    async def read(self, cursor, run):
+        """The next window of ``cursor`` as ``(songs, next_cursor)``.
+
+        ``songs`` are ``(url, duration)`` pairs; ``next_cursor`` is None once
+        the playlist is exhausted. ``run(fn)`` runs the blocking part off the
+        event loop and returns an awaitable.
+        """
+        entries = self._open.pop(cursor, None)
+        window, entries, next_cursor = await run(
+            lambda: self._read_window(cursor, entries)
+        )
+        if len(window) < WINDOW:
+            next_cursor = None
+        else:
+            self._open[next_cursor] = entries
+            while len(self._open) > OPEN_PLAYLISTS:
+                self._open.popitem(last=False)
+
+        songs = [
+            (
+                canonical_url(f"https://youtube.com/watch?v={entry['id']}"),
+                entry.get("duration"),
+            )
+            for entry in window
+            # Private and deleted videos come back empty or without an ID
+            if entry and entry.get("id")
+        ]
+        return songs, next_cursor
@@ -0,0 +1,117 @@
+import discord
+
+from modules.audio.playlist import parse_cursor
+
+# Songs shown per /queue page
+PAGE_SIZE = 10
+# Seconds the page buttons keep working after the last click
+VIEW_TIMEOUT = 180
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}:{minutes:02}:{seconds:02}"
+    return f"{minutes}:{seconds:02}"
+
+
+class QueueView(discord.ui.View):
+    """Paged /queue embed with buttons to flip through the queue.
+
+    Each page is rendered from ``TrackList.slice``, so only the songs on it
+    get their titles and requesters looked up; totals come from the counts
+    the queue keeps, never from walking it.
+    """
+
+    def __init__(self, cog, player, author_id):
+        super().__init__(timeout=VIEW_TIMEOUT)
+        self.cog = cog
+        self.player = player
+        self.author_id = author_id
+        self.page = 0
+        self.message = None
+
+    @property
+    def pages(self):
+        return max(1, -(-len(self.player.queue) // PAGE_SIZE))
+
+    def render(self):
+        queue = self.player.queue
+        self.page = min(self.page, self.pages - 1)
+        start = self.page * PAGE_SIZE
+
+        embed = discord.Embed(title="Music Queue", color=discord.Color.blue())
+        if self.player.is_playing and self.player.current_song:
+            embed.add_field(
+                name="Now Playing",
+                value=f"[{self.player.current_song.title}]({self.player.current_url})",
+                inline=False,
+            )
+
+        lines = []
+        guild = self.player.guild
+        for i, entry in enumerate(queue.slice(start, start + PAGE_SIZE), start + 1):
+            member = guild.get_member(entry.user_id)
+            mention = member.mention if member else f"User {entry.user_id}"
+            cursor = parse_cursor(entry.url)
+            if cursor is not None:
+                playlist_url, offset = cursor
+                lines.append(
+                    f"{i}. [Rest of playlist]({playlist_url}) from song {offset + 1} "
+                    f"(requested by {mention})"
+                )
+                continue
+            info = self.cog.track_info(entry.url)
+            title = info.get("title", "Unknown Title") if info else "Loading..."
+            lines.append(f"{i}. [{title}]({entry.url}) (requested by {mention})")
+        embed.description = "\n".join(lines) or "No songs in queue"
+
+        total = format_duration(queue.total_duration)
+        if queue.unknown_durations:
+            total += f" + {queue.unknown_durations} of unknown length"
+        embed.set_footer(
+            text=f"Page {self.page + 1}/{self.pages} • {len(queue)} songs • {total}"
+        )
+
+        self.first.disabled = self.previous.disabled = self.page == 0
+        self.next.disabled = self.last.disabled = self.page >= self.pages - 1
+        return embed
+
+    async def flip(self, interaction, page):
+        self.page = max(0, page)
+        await interaction.response.edit_message(embed=self.render(), view=self)
+
+    async def interaction_check(self, interaction):
+        if interaction.user.id != self.author_id:
+            await interaction.response.send_message(
+                "Use /queue to get your own view of the queue.", ephemeral=True
+            )
+            return False
+        return True
+
+    async def on_timeout(self):
+        if self.message is None:
+            return
+        for item in self.children:
+            item.disabled = True
+        try:
+            await self.message.edit(view=self)
+        except discord.HTTPException:
+            pass
+
+    @discord.ui.button(emoji="⏮️", style=discord.ButtonStyle.secondary)
+    async def first(self, interaction, button):
+        await self.flip(interaction, 0)
+
+    @discord.ui.button(emoji="◀️", style=discord.ButtonStyle.secondary)
+    async def previous(self, interaction, button):
+        await self.flip(interaction, self.page - 1)
+
+    @discord.ui.button(emoji="▶️", style=discord.ButtonStyle.secondary)
+    async def next(self, interaction, button):
+        await self.flip(interaction, self.page + 1)
+
+    @discord.ui.button(emoji="⏭️", style=discord.ButtonStyle.secondary)
+    async def last(self, interaction, button):
+        await self.flip(interaction, self.pages - 1)
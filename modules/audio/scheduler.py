@@ -0,0 +1,270 @@
+import time
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+# Job classes, most urgent first
+NOW_PLAYING = 0  # needed to start the current or next track
+INTERACTIVE = 1  # someone is waiting on a command
+BACKGROUND = 2  # prefetching, caching and library maintenance
+PRIORITIES = (NOW_PLAYING, INTERACTIVE, BACKGROUND)
+
+
+class JobAborted(Exception):
+    """Raised by ``checkpoint()`` in a job that was preempted or cancelled."""
+
+
+class Job:
+    __slots__ = (
+        "guild_id",
+        "priority",
+        "preemptible",
+        "fn",
+        "args",
+        "future",
+        "queued_at",
+    )
+
+    def __init__(self, guild_id, priority, preemptible, fn, args, future):
+        self.guild_id = guild_id
+        self.priority = priority
+        self.preemptible = preemptible
+        self.fn = fn
+        self.args = args
+        self.future = future
+        self.queued_at = time.monotonic()
+
+
+class RunningJob:
+    __slots__ = ("job", "abort", "preempted")
+
+    def __init__(self, job):
+        self.job = job
+        # Checked by the job itself, see ExtractionScheduler.checkpoint
+        self.abort = threading.Event()
+        self.preempted = False
+
+    def cancel_if_abandoned(self, future):
+        if future.cancelled():
+            self.abort.set()
+
+
+class ExtractionScheduler:
+    """Runs blocking yt-dlp calls on a dedicated, size-limited thread pool.
+
+    Jobs wait in one FIFO per guild and priority class. Whenever a worker
+    frees up, the most urgent class with work waiting goes first; within a
+    class the next job comes from the guild after the one served last, so a
+    guild queuing a thousand playlist entries can't starve another guild's
+    single /play. FFmpeg work done inside those jobs additionally has to
+    hold one of a smaller number of ``ffmpeg_slot()`` permits.
+
+    Jobs submitted as ``preemptible`` (background downloads) are asked to
+    stop when more urgent work is waiting and every worker is busy: their
+    next ``checkpoint()`` raises ``JobAborted`` and they go back to the front
+    of their queue. Cancelling the awaiting task aborts a job the same way.
+    """
+
+    def __init__(self, workers=4, ffmpeg_workers=2):
+        self.workers = workers
+        self.ffmpeg_workers = ffmpeg_workers
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="ytdl"
+        )
+        self._pending = {priority: OrderedDict() for priority in PRIORITIES}
+        self._running = set()
+        self._local = threading.local()
+        self._ffmpeg = threading.BoundedSemaphore(ffmpeg_workers)
+        self._ffmpeg_lock = threading.Lock()
+
+        self.running = 0
+        self.ffmpeg_running = 0
+        self.completed = 0
+        self.failed = 0
+        self.preempted = 0
+        self.cancelled = 0
+        self.wait_time = 0.0
+
+    async def run(self, guild_id, fn, *args, priority=INTERACTIVE, preemptible=False):
+        return await self.submit(
+            guild_id, fn, *args, priority=priority, preemptible=preemptible
+        )
+
+    def submit(self, guild_id, fn, *args, priority=INTERACTIVE, preemptible=False):
+        # Like run(), but hands back the future so the job can be promoted
+        future = asyncio.get_running_loop().create_future()
+        job = Job(guild_id, priority, preemptible, fn, args, future)
+        self._pending[priority].setdefault(guild_id, deque()).append(job)
+        self._dispatch()
+        return future
+
+    def promote(self, future, priority):
+        """Move the job behind ``future`` up to a more urgent class.
+
+        A promoted job is no longer preemptible; one that is running just
+        keeps running.
+        """
+        for running in self._running:
+            if running.job.future is future:
+                running.job.priority = min(running.job.priority, priority)
+                running.job.preemptible = False
+                return
+        for pending in self._pending.values():
+            for guild_id, jobs in pending.items():
+                for job in jobs:
+                    if job.future is not future:
+                        continue
+                    if priority < job.priority:
+                        jobs.remove(job)
+                        if not jobs:
+                            del pending[guild_id]
+                        job.priority = priority
+                        job.preemptible = False
+                        self._pending[priority].setdefault(guild_id, deque()).append(
+                            job
+                        )
+                        self._dispatch()
+                    return
+
+    def _next_job(self):
+        for priority in PRIORITIES:
+            pending = self._pending[priority]
+            if not pending:
+                continue
+            guild_id, jobs = next(iter(pending.items()))
+            job = jobs.popleft()
+            if jobs:
+                # Round-robin: this guild goes to the back of the line
+                pending.move_to_end(guild_id)
+            else:
+                del pending[guild_id]
+            return job
+        return None
+
+    def _dispatch(self):
+        while self.running < self.workers:
+            job = self._next_job()
+            if job is None:
+                return
+            if job.future.cancelled():
+                # Caller gave up while it was waiting
+                continue
+
+            self.running += 1
+            self.wait_time += time.monotonic() - job.queued_at
+            running = RunningJob(job)
+            self._running.add(running)
+            job.future.add_done_callback(running.cancel_if_abandoned)
+            done = asyncio.wrap_future(self.executor.submit(self._call, running))
+            done.add_done_callback(
+                lambda done, running=running: self._finish(running, done)
+            )
+        self._preempt()
+
+    def _preempt(self):
+        # Every worker is busy; make room if something more urgent waits
+        waiting = [priority for priority in PRIORITIES if self._pending[priority]]
+        if not waiting or any(running.preempted for running in self._running):
+            return
+        victims = [
+            running
+            for running in self._running
+            if running.job.preemptible
+            and running.job.priority > waiting[0]
+            and not running.abort.is_set()
+        ]
+        if victims:
+            victim = max(victims, key=lambda running: running.job.priority)
+            victim.preempted = True
+            victim.abort.set()
+
+    def _call(self, running):
+        self._local.running = running
+        try:
+            return running.job.fn(*running.job.args)
+        finally:
+            self._local.running = None
+
+    def checkpoint(self):
+        """Raise ``JobAborted`` if the job running on this thread should stop.
+
+        Called from inside jobs at points where stopping is safe, e.g. from
+        a yt-dlp progress hook between downloaded chunks.
+        """
+        running = getattr(self._local, "running", None)
+        if running is not None and running.abort.is_set():
+            raise JobAborted()
+
+    def _finish(self, running, done):
+        self.running -= 1
+        self._running.discard(running)
+        job = running.job
+        future = job.future
+        error = None if done.cancelled() else done.exception()
+        if future.cancelled():
+            self.cancelled += 1
+        elif running.preempted and isinstance(error, JobAborted):
+            # Back to the front of its queue; yt-dlp resumes the .part file
+            self.preempted += 1
+            job.queued_at = time.monotonic()
+            self._pending[job.priority].setdefault(job.guild_id, deque()).appendleft(
+                job
+            )
+            self._pending[job.priority].move_to_end(job.guild_id, last=False)
+        elif done.cancelled():
+            future.cancel()
+        elif error is not None:
+            self.failed += 1
+            future.set_exception(error)
+        else:
+            self.completed += 1
+            future.set_result(done.result())
+        self._dispatch()
+
+    @contextmanager
+    def ffmpeg_slot(self):
+        with self._ffmpeg:
+            with self._ffmpeg_lock:
+                self.ffmpeg_running += 1
+            try:
+                yield
+            finally:
+                with self._ffmpeg_lock:
+                    self.ffmpeg_running -= 1
+
+    def stats(self):
+        depths = {}
+        for pending in self._pending.values():
+            for guild_id, jobs in pending.items():
+                depths[guild_id] = depths.get(guild_id, 0) + len(jobs)
+        started = self.completed + self.failed + self.running
+        return {
+            "workers": self.workers,
+            "running": self.running,
+            "queued": sum(depths.values()),
+            "queued_by_priority": [
+                sum(len(jobs) for jobs in self._pending[priority].values())
+                for priority in PRIORITIES
+            ],
+            "guilds_waiting": len(depths),
+            "max_guild_depth": max(depths.values(), default=0),
+            "completed": self.completed,
+            "failed": self.failed,
+            "preempted": self.preempted,
+            "cancelled": self.cancelled,
+            "avg_wait": self.wait_time / started if started else 0.0,
+            "ffmpeg_workers": self.ffmpeg_workers,
+            "ffmpeg_running": self.ffmpeg_running,
+        }
+
+    def shutdown(self):
+        for pending in self._pending.values():
+            for jobs in pending.values():
+                for job in jobs:
+                    job.future.cancel()
+            pending.clear()
+        for running in self._running:
+            running.abort.set()
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,63 @@
+import time
+from collections import OrderedDict
+
+from modules.audio.library import log_write_error
+
+SEARCH_CACHE_SIZE = 10000
+# Search results drift over time, so resolve a query again after a day
+SEARCH_TTL = 24 * 60 * 60
+
+
+def normalize_query(query):
+    return " ".join(query.casefold().split())
+
+
+class SearchCache:
+    """Maps normalized search queries to the video URL they resolved to.
+
+    Recent queries are kept in memory in LRU order, everything is written
+    through to the library database so the cache survives restarts. Nothing
+    is preloaded; a memory miss falls back to one indexed lookup.
+    """
+
+    def __init__(self, library, size=SEARCH_CACHE_SIZE, ttl=SEARCH_TTL):
+        self.library = library
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+
+    def get(self, query):
+        key = normalize_query(query)
+        item = self.entries.get(key)
+        if item is None:
+            item = self.library.get_search(key)
+
+        if item is not None and time.time() - item[1] < self.ttl:
+            self.entries[key] = item
+            self.entries.move_to_end(key)
+            self._trim()
+            self.hits += 1
+            return item[0]
+
+        self.entries.pop(key, None)
+        self.misses += 1
+        return None
+
+    def put(self, query, url):
+        key = normalize_query(query)
+        now = time.time()
+        self.entries[key] = (url, now)
+        self.entries.move_to_end(key)
+        self._trim()
+        self.library.put_search(key, url, now).add_done_callback(log_write_error)
+
+    def prune(self):
+        pruned = self.library.prune_searches(time.time() - self.ttl)
+        pruned.add_done_callback(log_write_error)
+        return pruned
+
+    def _trim(self):
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
@@ -0,0 +1,85 @@
+import asyncio
+
+
+class Flight:
+    """One piece of work shared by everyone who asked for it meanwhile.
+
+    ``priority`` is that of the most urgent caller so far. Scheduler jobs
+    the work waits on are registered with ``follow`` so they can be moved
+    up when a more urgent caller joins.
+    """
+
+    __slots__ = ("task", "priority", "waiters", "abandoned", "_jobs")
+
+    def __init__(self, priority):
+        self.task = None
+        self.priority = priority
+        self.waiters = 0
+        self.abandoned = False
+        self._jobs = []
+
+    def follow(self, future, promote):
+        self._jobs = [job for job in self._jobs if not job[0].done()]
+        self._jobs.append((future, promote))
+        return future
+
+    def boost(self, priority):
+        if priority >= self.priority:
+            return
+        self.priority = priority
+        for future, promote in self._jobs:
+            if not future.done():
+                promote(future, priority)
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one task.
+
+    The first caller starts ``fn(flight)`` as a task, later ones await that
+    same task until it finishes, and all of them get its result or error.
+    A caller that is cancelled only stops waiting; the task itself is
+    cancelled once nobody is waiting for it any more. Callers arriving
+    while an abandoned task is still winding down wait for it to end and
+    then start afresh.
+    """
+
+    def __init__(self):
+        self.flights = {}
+        self.started = 0
+        self.joined = 0
+
+    def __len__(self):
+        return len(self.flights)
+
+    async def run(self, key, priority, fn):
+        flight = self.flights.get(key)
+        while flight is not None and flight.abandoned:
+            await asyncio.wait([flight.task])
+            flight = self.flights.get(key)
+
+        if flight is None:
+            flight = Flight(priority)
+            flight.task = asyncio.ensure_future(fn(flight))
+            flight.task.add_done_callback(lambda task: self._land(key, flight))
+            self.flights[key] = flight
+            self.started += 1
+        else:
+            flight.boost(priority)
+            self.joined += 1
+
+        flight.waiters += 1
+        try:
+            # Shielded: cancelling one caller mustn't cancel the others' work
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                flight.abandoned = True
+                flight.task.cancel()
+
+    def _land(self, key, flight):
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+        if not flight.task.cancelled():
+            # Every caller may have gone already; don't warn about it
+            flight.task.exception()
@@ -0,0 +1,87 @@
+import os
+import time
+import hashlib
+
+from modules.audio.locks import RangeLocks
+
+# Partial downloads older than this are left over from a crash
+STALE_PARTIAL = 6 * 60 * 60
+
+
+class TrackStore:
+    """Content-addressed layout for downloaded tracks.
+
+    Downloads land in ``<root>/.partial`` and are only moved into place by
+    ``commit`` once complete, as
+    ``<root>/<extractor>/<h0h1>/<h2h3>/<video id>-<hash>.<ext>`` where the
+    hash is the SHA-256 of the file. Two videos can never share a file and
+    the two shard levels keep directories small.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.partial_dir = os.path.join(root, ".partial")
+        os.makedirs(self.partial_dir, exist_ok=True)
+        # Held by whichever bot process is downloading a track, since they
+        # all download into the same partial files
+        self.download_locks = RangeLocks(os.path.join(root, ".downloads.lock"))
+
+    @property
+    def outtmpl(self):
+        return os.path.join(self.partial_dir, "%(extractor_key)s-%(id)s.%(ext)s")
+
+    def lock_download(self, url):
+        # Non-blocking; False while another process downloads ``url``
+        return self.download_locks.acquire(self._lock_slot(url))
+
+    def unlock_download(self, url):
+        self.download_locks.release(self._lock_slot(url))
+
+    @staticmethod
+    def _lock_slot(url):
+        # 48 bits of hash: a collision would only make two tracks wait
+        return int(hashlib.sha1(url.encode()).hexdigest()[:12], 16)
+
+    def path_for(self, extractor, video_id, digest, ext):
+        return os.path.join(
+            self.root,
+            extractor.lower(),
+            digest[:2],
+            digest[2:4],
+            f"{video_id}-{digest[:16]}{ext}",
+        )
+
+    def extractor_of(self, path):
+        # Files stored before this layout existed have no extractor directory
+        parts = os.path.relpath(path, self.root).split(os.sep)
+        return parts[0] if len(parts) == 4 else "generic"
+
+    @staticmethod
+    def digest(path):
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(block)
+        return sha.hexdigest()
+
+    def commit(self, tmp_path, extractor, video_id):
+        """Move a finished download into the store and return its path.
+
+        Blocking (hashes the whole file); run it off the event loop.
+        """
+        ext = os.path.splitext(tmp_path)[1]
+        final_path = self.path_for(extractor, video_id, self.digest(tmp_path), ext)
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        # Same filesystem, so this is an atomic rename; an identical file
+        # already in place is simply replaced by the same bytes
+        os.replace(tmp_path, final_path)
+        return final_path
+
+    def sweep_partials(self):
+        cutoff = time.time() - STALE_PARTIAL
+        removed = 0
+        for entry in os.scandir(self.partial_dir):
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        return removed
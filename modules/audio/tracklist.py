@@ -0,0 +1,205 @@
+import random
+from collections import namedtuple
+
+QueueEntry = namedtuple("QueueEntry", "id url user_id")
+
+# Entries per block; blocks are split once they reach twice this size
+BLOCK_SIZE = 512
+
+
+class TrackList:
+    """A song queue stored as a list of small blocks.
+
+    Positional access, insert, remove and move only touch one block plus a
+    walk over block lengths, instead of shifting the whole queue. Every
+    entry gets an ``id`` that stays the same while it is queued, so it can
+    be referred to no matter how the queue is reordered around it.
+
+    ``total_duration`` is kept up to date as entries come and go, for every
+    URL whose length was passed to ``learn_duration``; entries without one
+    are counted in ``unknown_durations``.
+    """
+
+    def __init__(self, next_id=1):
+        self.next_id = next_id
+        self._blocks = []
+        self._block_of = {}
+        self._len = 0
+
+        self.total_duration = 0
+        self.unknown_durations = 0
+        self._url_counts = {}
+        self._durations = {}
+
+    def __len__(self):
+        return self._len
+
+    def __bool__(self):
+        return self._len > 0
+
+    def __iter__(self):
+        for block in self._blocks:
+            yield from block
+
+    def __getitem__(self, index):
+        block_index, offset = self._locate(index)
+        return self._blocks[block_index][offset]
+
+    def _locate(self, index):
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("queue index out of range")
+        for block_index, block in enumerate(self._blocks):
+            if index < len(block):
+                return block_index, index
+            index -= len(block)
+
+    def slice(self, start, stop):
+        """Entries in positions [start, stop) without walking the rest."""
+        entries = []
+        position = 0
+        for block in self._blocks:
+            if position + len(block) > start:
+                entries.extend(
+                    block[max(start - position, 0) : max(stop - position, 0)]
+                )
+            position += len(block)
+            if position >= stop:
+                break
+        return entries
+
+    def index_of(self, entry_id):
+        block = self._block_of[entry_id]
+        position = 0
+        for other in self._blocks:
+            if other is block:
+                break
+            position += len(other)
+        for offset, entry in enumerate(block):
+            if entry.id == entry_id:
+                return position + offset
+
+    def _new_entry(self, url, user_id, entry_id=None):
+        if entry_id is None:
+            entry_id = self.next_id
+        self.next_id = max(self.next_id, entry_id + 1)
+        return QueueEntry(entry_id, url, user_id)
+
+    def append(self, url, user_id, entry_id=None):
+        return self._insert_entry(self._len, self._new_entry(url, user_id, entry_id))
+
+    def insert(self, index, url, user_id):
+        return self._insert_entry(index, self._new_entry(url, user_id))
+
+    def _insert_entry(self, index, entry):
+        index = max(0, min(index, self._len))
+        if index == self._len:
+            if not self._blocks or len(self._blocks[-1]) >= BLOCK_SIZE:
+                self._blocks.append([])
+            block_index, offset = len(self._blocks) - 1, len(self._blocks[-1])
+        else:
+            block_index, offset = self._locate(index)
+
+        block = self._blocks[block_index]
+        block.insert(offset, entry)
+        self._block_of[entry.id] = block
+        self._len += 1
+        self._count(entry.url, 1)
+        if len(block) >= 2 * BLOCK_SIZE:
+            tail = block[BLOCK_SIZE:]
+            del block[BLOCK_SIZE:]
+            self._blocks.insert(block_index + 1, tail)
+            for moved in tail:
+                self._block_of[moved.id] = tail
+        return entry
+
+    def _remove_at(self, block_index, offset):
+        block = self._blocks[block_index]
+        entry = block.pop(offset)
+        del self._block_of[entry.id]
+        self._len -= 1
+        self._count(entry.url, -1)
+        if not block:
+            del self._blocks[block_index]
+        elif block_index + 1 < len(self._blocks):
+            # Fold small neighbours together so blocks don't fragment
+            following = self._blocks[block_index + 1]
+            if len(block) + len(following) <= BLOCK_SIZE:
+                block.extend(following)
+                for moved in following:
+                    self._block_of[moved.id] = block
+                del self._blocks[block_index + 1]
+        return entry
+
+    def popleft(self):
+        if not self._len:
+            raise IndexError("pop from an empty queue")
+        return self._remove_at(0, 0)
+
+    def pop(self, index):
+        return self._remove_at(*self._locate(index))
+
+    def remove(self, entry_id):
+        return self.pop(self.index_of(entry_id))
+
+    def move(self, entry_id, index):
+        return self._insert_entry(index, self.remove(entry_id))
+
+    def drop_front(self, count):
+        """Remove the first ``count`` entries, whole blocks at a time."""
+        count = min(count, self._len)
+        while count and len(self._blocks[0]) <= count:
+            block = self._blocks.pop(0)
+            for entry in block:
+                del self._block_of[entry.id]
+                self._count(entry.url, -1)
+            self._len -= len(block)
+            count -= len(block)
+        for _ in range(count):
+            self._remove_at(0, 0)
+
+    def clear(self):
+        self._blocks.clear()
+        self._block_of.clear()
+        self._len = 0
+        self.total_duration = 0
+        self.unknown_durations = 0
+        self._url_counts.clear()
+        self._durations.clear()
+
+    def shuffle(self, seed):
+        entries = list(self)
+        random.Random(seed).shuffle(entries)
+        # Same entries, so the running totals stay as they are
+        self._blocks.clear()
+        for start in range(0, len(entries), BLOCK_SIZE):
+            block = entries[start : start + BLOCK_SIZE]
+            self._blocks.append(block)
+            for entry in block:
+                self._block_of[entry.id] = block
+
+    def _count(self, url, delta):
+        count = self._url_counts.get(url, 0) + delta
+        duration = self._durations.get(url)
+        if duration is None:
+            self.unknown_durations += delta
+        else:
+            self.total_duration += delta * duration
+        if count:
+            self._url_counts[url] = count
+        else:
+            del self._url_counts[url]
+            self._durations.pop(url, None)
+
+    def learn_duration(self, url, seconds):
+        """Record the length of a queued URL so the totals include it."""
+        count = self._url_counts.get(url)
+        if not count or not seconds or url in self._durations:
+            return
+        self._durations[url] = seconds
+        self.total_duration += count * seconds
+        self.unknown_durations -= count
+
+    def missing_durations(self):
+        return [url for url in self._url_counts if url not in self._durations]
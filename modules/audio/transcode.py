@@ -0,0 +1,127 @@
+import os
+import heapq
+import asyncio
+import itertools
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.audio.scheduler import NOW_PLAYING
+
+
+def transcode(source, target, codec, gain=0.0, keep_source=False):
+    """Turn ``source`` into Ogg Opus at ``target`` and delete the original.
+
+    Opus audio is only remuxed; anything else, and anything that needs a
+    ``gain`` (dB) applied, is encoded at 128 kbit/s. Blocking, and CPU-bound
+    unless it is a remux.
+    """
+    if gain:
+        audio = ["-af", f"volume={gain}dB", "-c:a", "libopus", "-b:a", "128k"]
+    elif codec == "opus":
+        audio = ["-c:a", "copy"]
+    else:
+        audio = ["-c:a", "libopus", "-b:a", "128k"]
+    # Written next to the target first, so a half-written file is never
+    # mistaken for a finished one (or clobbers a source with the same name)
+    tmp_path = target + ".tmp"
+    result = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-nostats", "-y", "-i", source]
+        + ["-map", "0:a:0", "-vn"]
+        + audio
+        + ["-f", "ogg", tmp_path],
+        capture_output=True,
+        timeout=1800,
+    )
+    if result.returncode != 0:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        lines = result.stderr.decode(errors="replace").strip().splitlines()
+        raise Exception(f"FFmpeg failed: {lines[-1] if lines else result.returncode}")
+    if not keep_source:
+        os.remove(source)
+    os.replace(tmp_path, target)
+    return target
+
+
+class TranscodePool:
+    """Post-processing stage that runs FFmpeg jobs on their own workers.
+
+    Downloads only fetch the raw audio on the yt-dlp threads and hand it over
+    here, so encoding never holds up the next download. Waiting jobs start
+    in the scheduler's priority order (``NOW_PLAYING`` first), then in the
+    order they were submitted. Each job is one FFmpeg process, so the threads
+    only wait on them; ``workers`` is how many may run at once.
+    """
+
+    def __init__(self, workers):
+        self.workers = max(1, workers)
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="transcode"
+        )
+        self._queue = []
+        self._order = itertools.count()
+
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+
+    async def run(self, priority, fn, *args):
+        return await self.submit(priority, fn, *args)
+
+    def submit(self, priority, fn, *args):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._order), future, fn, args))
+        self._dispatch()
+        return future
+
+    def promote(self, future, priority):
+        # Only waiting jobs have a place in line to improve
+        for i, job in enumerate(self._queue):
+            if job[2] is future:
+                if priority < job[0]:
+                    self._queue[i] = (priority,) + job[1:]
+                    heapq.heapify(self._queue)
+                return
+
+    def _dispatch(self):
+        while self.running < self.workers and self._queue:
+            _, _, future, fn, args = heapq.heappop(self._queue)
+            if future.cancelled():
+                continue
+            self.running += 1
+            done = asyncio.wrap_future(self.executor.submit(fn, *args))
+            done.add_done_callback(
+                lambda done, future=future: self._finish(future, done)
+            )
+
+    def _finish(self, future, done):
+        self.running -= 1
+        if done.cancelled():
+            future.cancel()
+        elif done.exception() is not None:
+            self.failed += 1
+            if not future.cancelled():
+                future.set_exception(done.exception())
+        else:
+            self.completed += 1
+            if not future.cancelled():
+                future.set_result(done.result())
+        self._dispatch()
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "running": self.running,
+            "queued": len(self._queue),
+            "now_playing_queued": sum(
+                1 for job in self._queue if job[0] == NOW_PLAYING
+            ),
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+    def shutdown(self):
+        for _, _, future, _, _ in self._queue:
+            future.cancel()
+        self._queue.clear()
+        self.executor.shutdown(wait=False, cancel_futures=True)
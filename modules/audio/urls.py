@@ -0,0 +1,48 @@
+import re
+from urllib.parse import urlparse, parse_qs
+
+YOUTUBE_HOSTS = {
+    "youtube.com",
+    "www.youtube.com",
+    "m.youtube.com",
+    "music.youtube.com",
+    "youtube-nocookie.com",
+    "www.youtube-nocookie.com",
+}
+VIDEO_ID = re.compile(r"^[0-9A-Za-z_-]{11}$")
+# Path prefixes that are followed by the video ID
+ID_PATHS = ("/shorts/", "/embed/", "/live/", "/v/")
+
+
+def video_id(url):
+    """Return the YouTube video ID in ``url``, or None if there isn't one."""
+    parsed = urlparse(url.strip())
+    host = parsed.netloc.lower().split(":")[0]
+
+    candidate = None
+    if host in ("youtu.be", "www.youtu.be"):
+        candidate = parsed.path.lstrip("/").split("/")[0]
+    elif host in YOUTUBE_HOSTS:
+        if parsed.path == "/watch":
+            candidate = parse_qs(parsed.query).get("v", [None])[0]
+        else:
+            for prefix in ID_PATHS:
+                if parsed.path.startswith(prefix):
+                    candidate = parsed.path[len(prefix) :].split("/")[0]
+                    break
+
+    if candidate and VIDEO_ID.match(candidate):
+        return candidate
+    return None
+
+
+def canonical_url(url):
+    """One URL per video, whatever form it was given in.
+
+    Timestamps, playlist context and host variants are dropped for YouTube
+    links; anything else is returned unchanged.
+    """
+    vid = video_id(url)
+    if vid is None:
+        return url.strip()
+    return f"https://www.youtube.com/watch?v={vid}"
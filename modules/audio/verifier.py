@@ -0,0 +1,209 @@
+import os
+import json
+import time
+import asyncio
+import subprocess
+
+from modules.audio.loudness import analyze
+from modules.audio.scheduler import BACKGROUND
+from modules.audio.transcode import transcode
+
+# Re-check every file this often, and wait this long between passes
+VERIFY_EVERY = 7 * 24 * 60 * 60
+IDLE_INTERVAL = 60 * 60
+# Wait before trying to load the index again after that failed
+RETRY_INTERVAL = 60
+BATCH_SIZE = 50
+# Smaller than this (bytes) or shorter than this (seconds) counts as broken
+MIN_SIZE = 1024
+MIN_DURATION = 1
+
+
+def probe(filepath, scheduler):
+    """Return (size, duration) for a playable file, or None if it is broken."""
+    try:
+        size = os.path.getsize(filepath)
+    except OSError:
+        return None
+    if size < MIN_SIZE:
+        return None
+
+    with scheduler.ffmpeg_slot():
+        result = subprocess.run(
+            [
+                "ffprobe",
+                "-v",
+                "error",
+                "-show_entries",
+                "format=duration",
+                "-of",
+                "json",
+                filepath,
+            ],
+            capture_output=True,
+            timeout=60,
+        )
+    if result.returncode != 0:
+        return None
+    try:
+        duration = float(json.loads(result.stdout)["format"]["duration"])
+    except (ValueError, KeyError):
+        return None
+    if duration < MIN_DURATION:
+        return None
+    return size, round(duration)
+
+
+def normalize(filepath, gain, store, video_id):
+    """Store a copy of ``filepath`` with ``gain`` (dB) applied; returns its
+    path and size. The original is left for the caller to replace."""
+    name = os.path.splitext(os.path.basename(filepath))[0]
+    tmp_path = os.path.join(store.partial_dir, f"normalize-{name}.opus")
+    transcode(filepath, tmp_path, None, gain=gain, keep_source=True)
+    new_path = store.commit(tmp_path, store.extractor_of(filepath), video_id)
+    return new_path, os.path.getsize(new_path)
+
+
+class LibraryVerifier:
+    """Background pass that ffprobes cached files and records the result.
+
+    Good files go into the library's in-memory index; missing or unreadable
+    ones are dropped from the library so they get downloaded again. Files
+    that have no loudness analysis yet (cached before it existed, or whose
+    analysis at download time failed to run) get one here. With a
+    ``gain_tolerance``, files that need at least that much gain are then
+    re-encoded with it applied and committed to ``store`` in their place,
+    so playback can pass them through untouched.
+
+    Probes are short and run on the extraction scheduler; loudness passes
+    and re-encodes go to ``transcoder`` with the other FFmpeg
+    post-processing.
+
+    Only the process holding ``lock`` does this; the others just reload
+    the index now and then to pick up what it verified.
+    """
+
+    def __init__(
+        self, library, scheduler, transcoder, store, lock=None, gain_tolerance=None
+    ):
+        self.library = library
+        self.scheduler = scheduler
+        self.transcoder = transcoder
+        self.store = store
+        self.lock = lock
+        self.gain_tolerance = gain_tolerance
+        self.verified = 0
+        self.dropped = 0
+        self.analyzed = 0
+        self.normalized = 0
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self.run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def run(self):
+        while True:
+            try:
+                indexed = await self.library.load_index()
+                break
+            except Exception as e:
+                print(f"Loading the library index failed, retrying: {e}")
+                await asyncio.sleep(RETRY_INTERVAL)
+        print(f"Library index loaded ({indexed} verified tracks)")
+        while True:
+            if self.lock is not None and not self.lock.acquire():
+                await asyncio.sleep(IDLE_INTERVAL)
+                try:
+                    await self.library.load_index()
+                except Exception as e:
+                    print(f"Reloading the library index failed: {e}")
+                continue
+            try:
+                checked = await self.verify_batch()
+                analyzed = await self.analyze_batch()
+                normalized = await self.normalize_batch()
+            except Exception as e:
+                print(f"Library verification failed: {e}")
+                checked = analyzed = normalized = 0
+            if max(checked, analyzed, normalized) < BATCH_SIZE:
+                await asyncio.sleep(IDLE_INTERVAL)
+
+    async def verify_batch(self):
+        rows = self.library.unverified(time.time() - VERIFY_EVERY, BATCH_SIZE)
+        good = []
+        for url, filepath in rows:
+            # Shares the extraction pool, behind anything a guild is waiting on
+            result = await self.scheduler.run(
+                None, probe, filepath, self.scheduler, priority=BACKGROUND
+            )
+            if result is None:
+                print(f"Dropping broken cached file: {filepath}")
+                await self.library.evict([url])
+                self.dropped += 1
+            else:
+                size, duration = result
+                good.append((url, filepath, size, duration, time.time()))
+
+        if good:
+            await self.library.record_verified(good)
+            self.verified += len(good)
+        return len(rows)
+
+    async def analyze_batch(self):
+        rows = self.library.unanalyzed(BATCH_SIZE)
+        results = []
+        normalized = []
+        for url, filepath, video_id in rows:
+            result = await self.transcoder.run(BACKGROUND, analyze, filepath)
+            # A file FFmpeg can't measure plays at unity gain from now on
+            loudness, gain = result if result is not None else (None, 0.0)
+            applied = None
+            if self.needs_gain(gain):
+                applied = await self.apply_gain(url, filepath, video_id, loudness, gain)
+            if applied is not None:
+                normalized.append(applied)
+            else:
+                results.append((url, filepath, loudness, gain))
+
+        if results:
+            await self.library.record_loudness(results)
+        if normalized:
+            await self.library.record_normalized(normalized)
+            self.normalized += len(normalized)
+        self.analyzed += len(rows)
+        return len(rows)
+
+    async def normalize_batch(self):
+        # Analysed before gains were applied to the files themselves
+        if self.gain_tolerance is None:
+            return 0
+        rows = self.library.unnormalized(self.gain_tolerance, BATCH_SIZE)
+        normalized = []
+        for url, filepath, video_id, loudness, gain in rows:
+            applied = await self.apply_gain(url, filepath, video_id, loudness, gain)
+            if applied is not None:
+                normalized.append(applied)
+
+        if normalized:
+            await self.library.record_normalized(normalized)
+            self.normalized += len(normalized)
+        return len(rows)
+
+    def needs_gain(self, gain):
+        return self.gain_tolerance is not None and abs(gain) >= self.gain_tolerance
+
+    async def apply_gain(self, url, filepath, video_id, loudness, gain):
+        try:
+            new_path, size = await self.transcoder.run(
+                BACKGROUND, normalize, filepath, gain, self.store, video_id or "track"
+            )
+        except Exception as e:
+            # Plays without the gain meanwhile; tried again next pass
+            print(f"Applying {gain} dB to {filepath} failed: {e}")
+            return None
+        return url, filepath, new_path, size, loudness, gain
@@ -1,16 +1,68 @@
 import os
-import json
+import time
 import asyncio
+import threading
+import functools
 import discord
-from collections import deque
 from discord.ext import commands
 
 import yt_dlp as youtube_dl
 
+from modules.audio.cache import CacheManager
+from modules.audio.downloads import DownloadPool
+from modules.audio.failures import (
+    PERMANENT,
+    RATE_LIMITED,
+    CircuitBreaker,
+    FailureCache,
+    RateLimited,
+    Unavailable,
+    backoff,
+    classify,
+)
+from modules.audio.gapless import FRAMES_PER_SECOND, TrackChain
+from modules.audio.journal import QueueJournal
+from modules.audio.library import Library, log_write_error
+from modules.audio.locks import FileLock
+from modules.audio.loudness import analyze
+from modules.audio.metrics import metrics
+from modules.audio.player import PlayerRegistry
+from modules.audio.playlist import PlaylistReader, cursor_url, is_cursor
+from modules.audio.queue_view import QueueView
+from modules.audio.scheduler import (
+    BACKGROUND,
+    INTERACTIVE,
+    NOW_PLAYING,
+    ExtractionScheduler,
+)
+from modules.audio.search_cache import SearchCache
+from modules.audio.singleflight import SingleFlight
+from modules.audio.store import TrackStore
+from modules.audio.transcode import TranscodePool, transcode
+from modules.audio.urls import canonical_url
+from modules.audio.verifier import LibraryVerifier
+
+# Finished downloads are moved from ./YTmusic/.partial into content-addressed paths
+track_store = TrackStore("./YTmusic")
+
+ytdl_seconds = metrics.histogram(
+    "ytdl_seconds", "Time yt-dlp spent on one extraction, by operation"
+)
+download_seconds = metrics.histogram(
+    "download_seconds", "Time to download and store a track that wasn't cached"
+)
+tracks_played = metrics.counter(
+    "tracks_played_total", "Tracks started, by where the audio came from"
+)
+ytdl_failures = metrics.counter(
+    "ytdl_failures_total", "Failed yt-dlp extractions, by kind of failure"
+)
+
 # Update the ytdl format options
 ytdl_format_options = {
-    "format": "bestaudio/best",
-    "outtmpl": "./YTmusic/%(title)s.%(ext)s",  # Save in YTmusic folder with original title
+    # Prefer Opus so it can be stored and sent to Discord without re-encoding
+    "format": "bestaudio[acodec=opus]/bestaudio/best",
+    "outtmpl": track_store.outtmpl,
     "restrictfilenames": True,
     "noplaylist": True,
     "nocheckcertificate": True,
@@ -20,17 +72,10 @@ ytdl_format_options = {
     "no_warnings": True,
     "default_search": "auto",
     "source_address": "0.0.0.0",
-    "extractaudio": True,
-    "audioformat": "mp3",
     # Add these new options for better compatibility
     "extractor_args": {"youtube": {"skip": ["dash", "hls"]}},
-    "postprocessors": [
-        {
-            "key": "FFmpegExtractAudio",
-            "preferredcodec": "mp3",
-            "preferredquality": "192",
-        }
-    ],
+    # No post-processors: the raw download is converted to Opus by the
+    # transcode stage, off the yt-dlp threads
     "ffmpeg_location": "/usr/bin/ffmpeg",  # Update this path if needed
 }
 
@@ -53,89 +98,390 @@ class YTDLSource(discord.PCMVolumeTransformer):
         self.thumbnail = data.get("thumbnail")
 
 
-os.makedirs("./data", exist_ok=True)
-os.makedirs("./YTmusic", exist_ok=True)
+class OpusSource(discord.FFmpegOpusAudio):
+    """Opus packets straight from FFmpeg, skipping PCM decode and re-encode."""
 
-QUEUE_FILE = "./data/queue.json"
-LIBRARY_FILE = "./data/library.json"
-
-
-def load_queue():
-    try:
-        if not os.path.exists(QUEUE_FILE):
-            with open(QUEUE_FILE, "w") as f:
-                json.dump([], f)
-            return deque()
+    def __init__(self, source, *, data, **kwargs):
+        super().__init__(source, **kwargs)
+        self.data = data
+        self.title = data.get("title")
+        self.url = data.get("url")
+        self.duration = data.get("duration")
+        self.thumbnail = data.get("thumbnail")
 
-        with open(QUEUE_FILE, "r") as f:
-            return deque(json.load(f))
-    except (FileNotFoundError, json.JSONDecodeError):
-        # If file is corrupted, reset it
-        with open(QUEUE_FILE, "w") as f:
-            json.dump([], f)
-        return deque()
 
+os.makedirs("./data", exist_ok=True)
 
-def load_library():
-    try:
-        if not os.path.exists(LIBRARY_FILE):
-            with open(LIBRARY_FILE, "w") as f:
-                json.dump({}, f)
-            return {}
+QUEUE_DIR = "./data"
+LIBRARY_DB = "./data/library.db"
+# Held by whichever bot process verifies the library and evicts from the cache
+MAINTENANCE_LOCK = "./data/maintenance.lock"
+# Pre-SQLite library, imported into LIBRARY_DB once and then renamed
+LIBRARY_FILE = "./data/library.json"
 
-        with open(LIBRARY_FILE, "r") as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        # If file is corrupted, reset it
-        with open(LIBRARY_FILE, "w") as f:
-            json.dump({}, f)
-        return {}
+# Start playing uncached songs straight from the stream URL while the file
+# is downloaded into the cache in the background
+STREAM_FIRST = True
+STREAM_BEFORE_OPTIONS = "-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5"
+# googlevideo stream URLs stop working after some hours; older ones are
+# resolved again instead of played
+STREAM_URL_TTL = 2 * 60 * 60
+
+# Send Opus to Discord directly; stored Opus files are passed through as-is.
+# Disable to fall back to FFmpegPCMAudio + volume scaling in Python.
+OPUS_PASSTHROUGH = True
+
+# Play every cached track at the same loudness, using the gain measured once
+# when it was cached. Tracks off by at least GAIN_TOLERANCE dB are stored
+# with the gain applied, so Opus passthrough still copies every file as is;
+# PCM playback (crossfade) folds any gain not in the file into the volume.
+NORMALIZE_LOUDNESS = True
+GAIN_TOLERANCE = 2.0
+
+# Seconds of the next track read ahead of time, and of overlap between two
+# tracks. Only PCM can be mixed, so crossfading turns off Opus passthrough.
+PREBUFFER_SECONDS = 1
+CROSSFADE_SECONDS = 0
+
+# Disk space the ./YTmusic cache may use before cold tracks are evicted
+CACHE_BUDGET = 20 * 1024**3
+
+# Threads running yt-dlp, and how many of them may run FFmpeg at once
+YTDL_WORKERS = 4
+FFMPEG_WORKERS = 2
+
+# FFmpeg processes converting downloads to Opus (and measuring their
+# loudness) at once, separately from the yt-dlp threads
+TRANSCODE_WORKERS = os.cpu_count() or 2
+
+# How many songs of a playlist window are cached ahead at the same time
+PLAYLIST_WORKERS = 4
+
+# Attempts per download; transient failures are retried after
+# RETRY_BASE_DELAY seconds, doubling up to RETRY_MAX_DELAY, with jitter.
+# Permanent ones (deleted, private, region locked) aren't retried at all.
+DOWNLOAD_RETRIES = 5
+RETRY_BASE_DELAY = 1
+RETRY_MAX_DELAY = 30
+# How often to check whether another bot process finished downloading a
+# track this one needs too
+DOWNLOAD_LOCK_POLL = 0.5
+
+# Once YouTube rate limits us, all extraction pauses for this long, doubling
+# while it keeps happening. /play fails fast meanwhile, background work and
+# playback wait for it to pass.
+RATE_LIMIT_COOLDOWN = 30
+RATE_LIMIT_MAX_COOLDOWN = 15 * 60
 
 
 class Music(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.ytdl = youtube_dl.YoutubeDL(ytdl_format_options)
+        # YoutubeDL instances aren't safe to share between executor threads
+        self._ytdl_local = threading.local()
+        self.extractor = ExtractionScheduler(YTDL_WORKERS, FFMPEG_WORKERS)
+        self.transcoder = TranscodePool(TRANSCODE_WORKERS)
+        # canonical url -> the download in progress for it
+        self.downloads = SingleFlight()
+
+        # The library is shared, queues and playback state live per guild
+        bot.song_library = Library(LIBRARY_DB, legacy_json=LIBRARY_FILE)
+        self.search_cache = SearchCache(bot.song_library)
+        self.search_cache.prune()
+        self.failures = FailureCache(bot.song_library)
+        self.failures.prune()
+        self.breaker = CircuitBreaker(RATE_LIMIT_COOLDOWN, RATE_LIMIT_MAX_COOLDOWN)
+        # Worker processes from launcher.py each journal their own guilds
+        worker = getattr(bot, "worker", None)
+        queue_dir = QUEUE_DIR
+        if worker is not None:
+            queue_dir = os.path.join(QUEUE_DIR, f"worker-{worker}")
+        self.queue_journal = QueueJournal(queue_dir)
+        self.players = PlayerRegistry(self, self.queue_journal)
+        maintenance = FileLock(MAINTENANCE_LOCK)
+        self.cache = CacheManager(
+            bot.song_library,
+            CACHE_BUDGET,
+            self.pinned_tracks,
+            lock=maintenance,
+            owner=worker or 0,
+        )
+        self.verifier = LibraryVerifier(
+            bot.song_library,
+            self.extractor,
+            self.transcoder,
+            track_store,
+            lock=maintenance,
+            gain_tolerance=GAIN_TOLERANCE if NORMALIZE_LOUDNESS else None,
+        )
+        # url -> stream info for songs that are playable but not cached yet
+        self.streams = {}
+        self.playlists = PlaylistReader(playlist_ydl_opts)
+        self._background = set()
+        # guild id -> its background tasks, cancelled by /stop
+        self._guild_background = {}
+        track_store.sweep_partials()
+
+    async def cog_load(self):
+        await self.learn_queued_durations()
+        self.cache.start()
+        self.verifier.start()
+
+    async def cog_unload(self):
+        for task in list(self._background):
+            task.cancel()
+        self.verifier.stop()
+        self.cache.stop()
+        await self.cache.flush()
+        self.players.shutdown()
+        self.extractor.shutdown()
+        self.transcoder.shutdown()
+        self.queue_journal.close()
+        self.bot.song_library.close()
+
+    def thread_ytdl(self):
+        ytdl = getattr(self._ytdl_local, "ytdl", None)
+        if ytdl is None:
+            ytdl = self._ytdl_local.ytdl = youtube_dl.YoutubeDL(ytdl_format_options)
+            # Lets the scheduler stop a download between chunks
+            ytdl.add_progress_hook(lambda status: self.extractor.checkpoint())
+        return ytdl
+
+    def pinned_tracks(self):
+        # Anything queued in any guild, or playing right now, stays cached
+        pinned = {
+            canonical_url(entry.url)
+            for queue in self.queue_journal.queues.values()
+            for entry in queue
+        }
+        pinned.update(player.current_url for player in self.players)
+        return pinned
+
+    async def learn_queued_durations(self):
+        # Queues restored from the journal only know their URLs
+        queues = list(self.queue_journal.queues.values())
+        missing = {url for queue in queues for url in queue.missing_durations()}
+        if not missing:
+            return
+        durations = await self.bot.song_library.durations(missing)
+        for queue in queues:
+            for url in queue.missing_durations():
+                if url in durations:
+                    queue.learn_duration(url, durations[url])
+
+    async def extract(
+        self, guild_id, query, download, priority=INTERACTIVE, flight=None
+    ):
+        # Searches can't fail permanently, URLs (canonical here) can
+        is_url = not query.startswith("ytsearch")
+        if is_url:
+            reason = self.failures.get(query)
+            if reason is not None:
+                raise Unavailable(reason)
+        if self.breaker.is_open:
+            if priority == INTERACTIVE:
+                raise RateLimited(
+                    "YouTube is rate limiting the bot, "
+                    f"try again in {self.breaker.remaining():.0f}s"
+                )
+            await self.breaker.wait()
+
+        def run():
+            with ytdl_seconds.time(op="download" if download else "extract"):
+                return self.thread_ytdl().extract_info(query, download=download)
+
+        try:
+            # Only background downloads make way for more urgent jobs
+            job = self.extractor.submit(
+                guild_id,
+                run,
+                priority=priority,
+                preemptible=download and priority == BACKGROUND,
+            )
+            if flight is not None:
+                # Moved up if someone more urgent joins the download
+                flight.follow(job, self.extractor.promote)
+            data = await job
+        except Exception as e:
+            kind = classify(e)
+            ytdl_failures.inc(kind=kind)
+            if kind == RATE_LIMITED:
+                self.breaker.trip()
+            elif kind == PERMANENT and is_url:
+                self.failures.put(query, e)
+            raise
+        self.breaker.succeeded()
+        return data
+
+    def cached_path(self, url):
+        url = canonical_url(url)
+        filepath = self.bot.song_library.indexed_path(url)
+        if filepath is not None:
+            return filepath
+
+        # Not verified yet, check the file itself
+        if url not in self.bot.song_library:
+            return None
 
-        # Initialize queue and library
-        bot.song_queue = load_queue()
-        bot.song_library = load_library()
-        bot.current_song = None
-        bot.is_playing = False
+        cached_entry = self.bot.song_library[url]
+        cached_path = cached_entry.get("filepath", "")
+
+        # Verify the cached file exists and is valid
+        if os.path.exists(cached_path):
+            # Additional verification - check file size
+            if os.path.getsize(cached_path) > 1024:  # At least 1KB
+                return cached_path
+            else:
+                print(f"Removing invalid cached file (too small): {cached_path}")
+                os.remove(cached_path)
+                removed = self.bot.song_library.remove(url)
+                removed.add_done_callback(log_write_error)
+        return None
+
+    def track_info(self, url):
+        url = canonical_url(url)
+        entry = self.bot.song_library.get(url)
+        if entry is not None:
+            return entry
+        return self.streams.get(url)
+
+    def fresh_stream(self, url):
+        info = self.streams.get(url)
+        if info is not None and time.time() - info["resolved_at"] < STREAM_URL_TTL:
+            return info
+        return None
+
+    def expire_streams(self):
+        cutoff = time.time() - STREAM_URL_TTL
+        for url in [
+            url for url, info in self.streams.items() if info["resolved_at"] < cutoff
+        ]:
+            del self.streams[url]
+
+    async def resolve_stream(self, url, data=None, guild_id=None, priority=INTERACTIVE):
+        url = canonical_url(url)
+        if data is None or not data.get("url"):
+            data = await self.extract(guild_id, url, download=False, priority=priority)
+            if data and "entries" in data:
+                data = data["entries"][0]
+        if not data or not data.get("url"):
+            raise Exception("No stream URL received from YouTube")
+
+        info = {
+            "title": data.get("title", "Unknown Title"),
+            "stream_url": data["url"],
+            "codec": data.get("acodec", ""),
+            "duration": data.get("duration", 0),
+            "thumbnail": data.get("thumbnail", ""),
+            "resolved_at": time.time(),
+        }
+        self.expire_streams()
+        self.streams[url] = info
+        return info
+
+    def cache_in_background(self, url, guild_id=None):
+        url = canonical_url(url)
+
+        async def cache():
+            try:
+                await self.download_song(url, guild_id=guild_id, priority=BACKGROUND)
+            except Exception as e:
+                print(f"Background caching failed for {url}: {e}")
+            finally:
+                # Cached now, or resolved again when it comes up to play
+                self.streams.pop(url, None)
+
+        self.spawn(guild_id, cache())
+
+    def spawn(self, guild_id, coro):
+        task = self.bot.loop.create_task(coro)
+        tasks = self._guild_background.setdefault(guild_id, set())
+        tasks.add(task)
+        self._background.add(task)
+
+        def done(task):
+            self._background.discard(task)
+            tasks.discard(task)
+            if not tasks and self._guild_background.get(guild_id) is tasks:
+                del self._guild_background[guild_id]
+
+        task.add_done_callback(done)
+        return task
+
+    def cancel_background(self, guild_id):
+        # Cancelling the tasks also aborts their queued and running downloads
+        for task in list(self._guild_background.get(guild_id, ())):
+            task.cancel()
+
+    async def read_playlist(self, guild_id, cursor, priority=INTERACTIVE):
+        songs, next_cursor = await self.playlists.read(
+            cursor, functools.partial(self.extractor.run, guild_id, priority=priority)
+        )
+        self.prefetch(guild_id, [url for url, _ in songs])
+        return songs, next_cursor
+
+    def prefetch(self, guild_id, urls):
+        # Cache a playlist window ahead of playback, a few songs at a time
+        pool = DownloadPool(
+            functools.partial(
+                self.download_song, guild_id=guild_id, priority=BACKGROUND
+            ),
+            workers=PLAYLIST_WORKERS,
+        )
 
-    # Paths for data files
-    def save_queue(self):
-        with open(QUEUE_FILE, "w") as f:
-            json.dump(list(self.bot.song_queue), f)
+        async def fetch():
+            async for url, _, error in pool.map(urls):
+                if error is not None:
+                    print(f"Prefetching {url} failed: {error}")
+
+        self.spawn(guild_id, fetch())
+
+    async def download_song(
+        self, url, retries=DOWNLOAD_RETRIES, guild_id=None, priority=INTERACTIVE
+    ):
+        # Library entries are keyed by one URL per video
+        url = canonical_url(url)
+        cached_path = self.use_cached(url)
+        if cached_path:
+            return cached_path
+        # Everyone asking for the track while it downloads shares one download
+        return await self.downloads.run(
+            url, priority, functools.partial(self.fetch_track, url, retries, guild_id)
+        )
 
-    def save_library(self):
-        with open(LIBRARY_FILE, "w") as f:
-            json.dump(self.bot.song_library, f)
+    def use_cached(self, url):
+        cached_path = self.cached_path(url)
+        if cached_path:
+            # No title here: that would be a full row read on every hit
+            print(f"Using cached version of {url}")
+            self.cache.touch(url)
+        return cached_path
+
+    async def fetch_track(self, url, retries, guild_id, flight):
+        # Another bot process may be downloading it into the same partial
+        # file; wait for that one and then use what it stored
+        while not track_store.lock_download(url):
+            await asyncio.sleep(DOWNLOAD_LOCK_POLL)
+        try:
+            return await self.fetch_track_locked(url, retries, guild_id, flight)
+        finally:
+            track_store.unlock_download(url)
 
-    async def download_song(self, url, retries=10):
+    async def fetch_track_locked(self, url, retries, guild_id, flight):
         for attempt in range(retries):
             try:
-                if url in self.bot.song_library:
-                    cached_entry = self.bot.song_library[url]
-                    cached_path = cached_entry.get("filepath", "")
-
-                    # Verify the cached file exists and is valid
-                    if os.path.exists(cached_path):
-                        # Additional verification - check file size
-                        if os.path.getsize(cached_path) > 1024:  # At least 1KB
-                            print(
-                                f"Using cached version of {cached_entry.get('title', 'unknown')}"
-                            )
-                            return cached_path
-                        else:
-                            print(
-                                f"Removing invalid cached file (too small): {cached_path}"
-                            )
-                            os.remove(cached_path)
-                            del self.bot.song_library[url]
+                cached_path = self.use_cached(url)
+                if cached_path:
+                    return cached_path
                 # start download
-                data = await self.bot.loop.run_in_executor(
-                    None, lambda: self.ytdl.extract_info(url, download=True)
+                started = time.perf_counter()
+                data = await self.extract(
+                    guild_id,
+                    url,
+                    download=True,
+                    priority=flight.priority,
+                    flight=flight,
                 )
 
                 if not data:
@@ -147,106 +493,194 @@ class Music(commands.Cog):
                         raise Exception("No playlist data received")
 
                 filename = self.ytdl.prepare_filename(data)
-                base, ext = os.path.splitext(filename)
-                mp3_file = base + ".mp3"
-
-                if not os.path.exists(mp3_file):
+                if not os.path.exists(filename):
                     raise Exception("Downloaded file not found")
 
+                # The yt-dlp thread is free again; measuring and conversion
+                # wait their turn
+                loudness = gain = None
+                try:
+                    measured = await flight.follow(
+                        self.transcoder.submit(flight.priority, analyze, filename),
+                        self.transcoder.promote,
+                    )
+                    loudness, gain = measured if measured else (None, 0.0)
+                except Exception as e:
+                    # Left for the library verifier to retry
+                    print(f"Loudness analysis failed for {url}: {e}")
+                # Baked into the file while it is encoded anyway, so
+                # playback can pass it through untouched
+                applied = (
+                    NORMALIZE_LOUDNESS
+                    and gain is not None
+                    and abs(gain) >= GAIN_TOLERANCE
+                )
+
+                partial_file = await flight.follow(
+                    self.transcoder.submit(
+                        flight.priority,
+                        transcode,
+                        filename,
+                        os.path.splitext(filename)[0] + ".opus",
+                        data.get("acodec"),
+                        gain if applied else 0.0,
+                    ),
+                    self.transcoder.promote,
+                )
+
+                opus_file = await self.extractor.run(
+                    guild_id,
+                    track_store.commit,
+                    partial_file,
+                    data.get("extractor_key", "generic"),
+                    data["id"],
+                    priority=flight.priority,
+                )
+
                 # Add to library
-                self.bot.song_library[url] = {
-                    "title": data.get("title", "Unknown Title"),
-                    "filepath": mp3_file,
-                    "duration": data.get("duration", 0),
-                    "thumbnail": data.get("thumbnail", ""),
-                }
-
-                self.save_library()
-                return mp3_file
+                size = os.path.getsize(opus_file)
+                await self.bot.song_library.put(
+                    url,
+                    {
+                        "video_id": data.get("id"),
+                        "title": data.get("title", "Unknown Title"),
+                        "filepath": opus_file,
+                        "codec": "opus",
+                        "duration": data.get("duration", 0),
+                        "thumbnail": data.get("thumbnail", ""),
+                        "size": size,
+                        "last_access": time.time(),
+                        # Just written by FFmpeg and committed, no need to probe
+                        "verified_at": time.time(),
+                        "loudness": loudness,
+                        "gain": gain,
+                        "gain_applied": 1 if applied else 0,
+                    },
+                )
+                self.cache.added(size)
+                download_seconds.observe(time.perf_counter() - started)
+                return opus_file
             except Exception as e:
+                kind = classify(e)
+                # A rate limited /play has already been told to come back
+                # later; everyone else waits for the breaker in extract()
+                if kind == PERMANENT or (
+                    kind == RATE_LIMITED and flight.priority == INTERACTIVE
+                ):
+                    print(f"Not retrying {url} ({kind}): {e}")
+                    raise
                 if attempt == retries - 1:
                     print(f"Final attempt failed for {url}: {e}")
                     raise
-                print(f"Attempt {attempt + 1} failed for {url}, retrying...")
-                await asyncio.sleep(2)
-
-    async def play_next(self, ctx):
-        if len(self.bot.song_queue) > 0:
-            self.bot.is_playing = True
-            url, user_id = self.bot.song_queue.popleft()
-            self.save_queue()
-
-            try:
-                requester = ctx.guild.get_member(user_id)
-                requester_mention = (
-                    requester.mention if requester else f"User {user_id}"
+                delay = backoff(attempt, RETRY_BASE_DELAY, RETRY_MAX_DELAY)
+                print(
+                    f"Attempt {attempt + 1} failed for {url} ({kind}), "
+                    f"retrying in {delay:.1f}s..."
                 )
+                await asyncio.sleep(delay)
+
+    def create_source(self, song_data, location, before_options=None):
+        if OPUS_PASSTHROUGH and not CROSSFADE_SECONDS:
+            # Library entries from before Opus storage have no codec and are
+            # MP3; those get encoded to Opus by FFmpeg instead of discord.py.
+            # Gains are applied to the stored files, never here.
+            is_opus = song_data.get("codec") == "opus"
+            return OpusSource(
+                location,
+                data=song_data,
+                codec="copy" if is_opus else "libopus",
+                before_options=before_options,
+                options="-vn",
+            )
 
-                # Assume file exists and is in song_library
-                song_data = self.bot.song_library[url]
-                filepath = song_data["filepath"]
-
-                # Create audio source with proper FFmpeg options
-                source = discord.FFmpegPCMAudio(
-                    executable="ffmpeg",
-                    source=filepath,
-                    options="-vn -b:a 128k -ar 48000 -ac 2",
+        # Streams and tracks not analysed yet have no gain, and a file may
+        # have it applied already
+        gain = 0.0
+        if NORMALIZE_LOUDNESS and not song_data.get("gain_applied"):
+            gain = song_data.get("gain") or 0.0
+        source = discord.FFmpegPCMAudio(
+            executable="ffmpeg",
+            source=location,
+            before_options=before_options,
+            options="-vn -ar 48000 -ac 2",
+        )
+        return YTDLSource(source, data=song_data, volume=0.5 * 10 ** (gain / 20))
+
+    async def open_track(self, guild_id, url):
+        """Source for ``url``, and whether it came from cache, stream or download."""
+        url = canonical_url(url)
+        filepath = self.cached_path(url)
+        if filepath and not os.path.exists(filepath):
+            # Evicted by another worker process since it was indexed here
+            self.bot.song_library.forget(url)
+            filepath = self.cached_path(url)
+        origin = "cache" if filepath else "stream"
+        if filepath is None and self.fresh_stream(url) is None:
+            # Evicted since it was queued, queued before a restart, or the
+            # stream URL has probably expired
+            if STREAM_FIRST:
+                await self.resolve_stream(url, guild_id=guild_id, priority=NOW_PLAYING)
+                self.cache_in_background(url, guild_id=guild_id)
+            else:
+                filepath = await self.download_song(
+                    url, guild_id=guild_id, priority=NOW_PLAYING
                 )
+                origin = "download"
 
-                self.bot.current_song = YTDLSource(source, data=song_data)
+        if filepath:
+            self.cache.touch(url)
+            current_song = self.create_source(self.bot.song_library[url], filepath)
+        else:
+            # Not cached yet, play straight from YouTube
+            song_data = self.streams[url]
+            current_song = self.create_source(
+                song_data,
+                song_data["stream_url"],
+                before_options=STREAM_BEFORE_OPTIONS,
+            )
 
-                if not self.bot.current_song or not hasattr(
-                    self.bot.current_song, "title"
-                ):
-                    raise Exception("Invalid song data received")
-
-                ctx.voice_client.play(
-                    self.bot.current_song,
-                    after=lambda e: (
-                        asyncio.run_coroutine_threadsafe(
-                            self.play_next(ctx), self.bot.loop
-                        )
-                        if e is None
-                        else print(f"Player error: {e}")
-                    ),
-                )
+        if not current_song or not hasattr(current_song, "title"):
+            raise Exception("Invalid song data received")
+        return current_song, origin
+
+    async def start_track(self, player, url, user_id):
+        url = canonical_url(url)
+        current_song, origin = await self.open_track(player.guild.id, url)
+        # Later tracks are prepared behind this one and follow on without a gap
+        player.chain = TrackChain(
+            current_song,
+            player.track_advanced,
+            prebuffer=int(PREBUFFER_SECONDS * FRAMES_PER_SECOND),
+            crossfade=int(CROSSFADE_SECONDS * FRAMES_PER_SECOND),
+        )
+        player.guild.voice_client.play(player.chain, after=player.track_finished)
+        await self.track_started(player, current_song, url, user_id, origin)
 
-                # Create embed
-                embed = discord.Embed(
-                    title="Now Playing",
-                    description=f"[{self.bot.current_song.title}]({url})",
-                    color=discord.Color.green(),
-                )
+    async def track_started(self, player, current_song, url, user_id, origin):
+        tracks_played.inc(source=origin)
+        player.current_song = current_song
+        player.current_url = url
+        requester = player.guild.get_member(user_id)
+        requester_mention = requester.mention if requester else f"User {user_id}"
 
-                if (
-                    hasattr(self.bot.current_song, "thumbnail")
-                    and self.bot.current_song.thumbnail
-                ):
-                    embed.set_thumbnail(url=self.bot.current_song.thumbnail)
+        # Create embed
+        embed = discord.Embed(
+            title="Now Playing",
+            description=f"[{current_song.title}]({url})",
+            color=discord.Color.green(),
+        )
 
-                if (
-                    hasattr(self.bot.current_song, "duration")
-                    and self.bot.current_song.duration
-                ):
-                    minutes, seconds = divmod(self.bot.current_song.duration, 60)
-                    embed.add_field(
-                        name="Duration", value=f"{minutes}:{seconds:02}", inline=True
-                    )
+        if hasattr(current_song, "thumbnail") and current_song.thumbnail:
+            embed.set_thumbnail(url=current_song.thumbnail)
 
-                embed.add_field(
-                    name="Requested by", value=requester_mention, inline=True
-                )
-                await ctx.send(embed=embed)
+        if hasattr(current_song, "duration") and current_song.duration:
+            minutes, seconds = divmod(current_song.duration, 60)
+            embed.add_field(
+                name="Duration", value=f"{minutes}:{seconds:02}", inline=True
+            )
 
-            except Exception as e:
-                print(f"Error playing song: {e}")
-                self.bot.is_playing = False
-                await ctx.send(f"Error playing song: {str(e)}")
-                await self.play_next(ctx)
-        else:
-            self.bot.is_playing = False
-            self.bot.current_song = None
-            await ctx.send("Queue is empty!")
+        embed.add_field(name="Requested by", value=requester_mention, inline=True)
+        await player.channel.send(embed=embed)
 
     async def ensure_voice_client(self, ctx, voice_channel):
         try:
@@ -297,33 +731,43 @@ class Music(commands.Cog):
             ctx.send("Work")
             try:
                 await ctx.send("Start looking")
+                entry = None
                 if query.startswith("http"):
                     url = query
                 else:
+                    url = self.search_cache.get(query)
+                if url is None:
                     search_query = f"ytsearch:{query}"
-                    data = await self.bot.loop.run_in_executor(
-                        None,
-                        lambda: self.ytdl.extract_info(search_query, download=False),
+                    data = await self.extract(
+                        ctx.guild.id, search_query, download=False
                     )
                     if not data or "entries" not in data or not data["entries"]:
                         return await ctx.send("No results found!")
-                    url = data["entries"][0]["webpage_url"]
+                    entry = data["entries"][0]
+                    url = canonical_url(entry["webpage_url"])
+                    self.search_cache.put(query, url)
+                url = canonical_url(url)
+
+                if STREAM_FIRST and not self.cached_path(url):
+                    # Play from the stream now, cache the file for next time
+                    await self.resolve_stream(url, data=entry, guild_id=ctx.guild.id)
+                    self.cache_in_background(url, guild_id=ctx.guild.id)
+                else:
+                    # Show "downloading" message
+                    msg = await ctx.send("⏳ Downloading song...")
 
-                # Show "downloading" message
-                msg = await ctx.send("⏳ Downloading song...")
+                    filepath = await self.download_song(url, guild_id=ctx.guild.id)
+                    if not filepath:
+                        return await ctx.send("Failed to download the song!")
 
-                filepath = await self.download_song(url)
-                if not filepath:
-                    return await ctx.send("Failed to download the song!")
+                    await msg.delete()  # Remove downloading message
 
-                await msg.delete()  # Remove downloading message
-                self.bot.song_queue.append((url, ctx.author.id))
-                self.save_queue()
+                player = self.players.get(ctx)
+                busy = player.is_playing or len(player.queue) > 0
+                player.enqueue(url, ctx.author.id)
 
-                if not self.bot.is_playing:
-                    await self.play_next(ctx)
-                else:
-                    title = self.bot.song_library[url]["title"]
+                if busy:
+                    title = self.track_info(url)["title"]
                     await ctx.send(f"Added to queue: **{title}**")
             except Exception as e:
                 await ctx.send(f"Error processing song: {str(e)}")
@@ -347,42 +791,25 @@ class Music(commands.Cog):
         try:
             msg = await ctx.send("⏳ Processing playlist...")
 
-            ydl_opts = {
-                "quiet": True,
-                "no_warnings": True,
-                "extract_flat": True,
-            }
-
-            with youtube_dl.YoutubeDL(ydl_opts) as ydl:
-                data = ydl.extract_info(url, download=False)
-
-            if "entries" not in data or not data["entries"]:
+            # Only the first window is read now, the rest as the queue plays
+            songs, next_cursor = await self.read_playlist(
+                ctx.guild.id, cursor_url(url, 0)
+            )
+            if not songs and next_cursor is None:
                 await ctx.send("This doesn't appear to be a valid playlist.")
                 return
 
-            count = 0
-            for entry in data["entries"]:
-                song_url = f"https://youtube.com/watch?v={entry['id']}"
-                try:
-                    filepath = await self.download_song(song_url)
-                    if filepath:
-                        self.bot.song_queue.append((song_url, ctx.author.id))
-                        count += 1
-                        self.save_queue()
-                        if not self.bot.is_playing:
-                            await self.play_next(ctx)
-
-                    else:
-                        await ctx.send(f"⚠️ Failed to download: {song_url}")
-                except Exception as e:
-                    await ctx.send(f"⚠️ Error downloading a song: {e}")
+            player = self.players.get(ctx)
+            player.enqueue_playlist(songs, next_cursor, ctx.author.id)
 
-            self.save_queue()
             await msg.delete()
-            await ctx.send(f"✅ Added {count} songs from playlist to queue!")
-
-            if not self.bot.is_playing:
-                await self.play_next(ctx)
+            if next_cursor is None:
+                await ctx.send(f"✅ Added {len(songs)} songs from playlist to queue!")
+            else:
+                await ctx.send(
+                    f"✅ Added {len(songs)} songs from playlist to queue, "
+                    "the rest follow as it plays!"
+                )
 
         except Exception as e:
             await ctx.send(f"Error processing playlist: {e}")
@@ -390,44 +817,23 @@ class Music(commands.Cog):
 
     @commands.command(name="queue", help="Shows the current queue")
     async def show_queue(self, ctx):
-        if len(self.bot.song_queue) == 0 and not self.bot.is_playing:
+        player = self.players.find(ctx.guild.id)
+        if player is None or (len(player.queue) == 0 and not player.is_playing):
             await ctx.send("Queue is empty!")
             return
 
-        embed = discord.Embed(title="Music Queue", color=discord.Color.blue())
-
-        if self.bot.is_playing and self.bot.current_song:
-            embed.add_field(
-                name="Now Playing",
-                value=f"[{self.bot.current_song.title}]({self.bot.current_song.url})",
-                inline=False,
-            )
-
-        if len(self.bot.song_queue) > 0:
-            queue_list = []
-            for i, (url, user_id) in enumerate(self.bot.song_queue, 1):
-                member = ctx.guild.get_member(user_id)
-                mention = member.mention if member else f"User {user_id}"
-                title = (
-                    self.bot.song_library.get(url, {}).get("title", "Unknown Title")
-                    if url in self.bot.song_library
-                    else "Loading..."
-                )
-                queue_list.append(f"{i}. [{title}]({url}) (requested by {mention})")
-
-            embed.description = "\n".join(queue_list[:10])
-            if len(self.bot.song_queue) > 10:
-                embed.set_footer(
-                    text=f"And {len(self.bot.song_queue) - 10} more songs..."
-                )
-        else:
-            embed.description = "No songs in queue"
-
-        await ctx.send(embed=embed)
+        view = QueueView(self, player, ctx.author.id)
+        embed = view.render()
+        if view.pages == 1:
+            view.stop()
+            await ctx.send(embed=embed)
+            return
+        view.message = await ctx.send(embed=embed, view=view)
 
     @commands.command(name="skip", help="Skips the current song")
     async def skip(self, ctx):
-        if not self.bot.is_playing:
+        player = self.players.find(ctx.guild.id)
+        if player is None or not player.is_playing:
             await ctx.send("No song is currently playing!")
             return
 
@@ -437,21 +843,83 @@ class Music(commands.Cog):
 
     @commands.command(name="stop", help="Stops the music and clears the queue")
     async def stop(self, ctx):
-        if not self.bot.is_playing:
+        player = self.players.find(ctx.guild.id)
+        if player is None or not player.is_playing:
             await ctx.send("No music is playing!")
             return
 
         if ctx.voice_client:
-            self.bot.song_queue.clear()
-            self.save_queue()
+            player.clear()
+            # Nothing left to play, so nothing left worth fetching either
+            self.cancel_background(ctx.guild.id)
             ctx.voice_client.stop()
-            self.bot.is_playing = False
-            self.bot.current_song = None
             await ctx.send("⏹️ Stopped playback and cleared queue!")
 
+    def queued_player(self, ctx, *positions):
+        # Positions are 1-based, as shown by /queue
+        player = self.players.find(ctx.guild.id)
+        if player is None:
+            return None
+        if all(1 <= position <= len(player.queue) for position in positions):
+            return player
+        return None
+
+    def queued_title(self, url):
+        if is_cursor(url):
+            return "the rest of the playlist"
+        info = self.track_info(url)
+        return info.get("title", "Unknown Title") if info else url
+
+    @commands.command(name="remove", help="Removes the song at a queue position")
+    async def remove(self, ctx, position: int):
+        player = self.queued_player(ctx, position)
+        if player is None:
+            await ctx.send("There is no song at that position!")
+            return
+
+        entry = player.remove(position - 1)
+        await ctx.send(f"🗑️ Removed **{self.queued_title(entry.url)}** from the queue!")
+
+    @commands.command(name="move", help="Moves a queued song to another position")
+    async def move(self, ctx, position: int, new_position: int):
+        player = self.queued_player(ctx, position, new_position)
+        if player is None:
+            await ctx.send("There is no song at that position!")
+            return
+
+        entry = player.move(position - 1, new_position - 1)
+        await ctx.send(
+            f"↕️ Moved **{self.queued_title(entry.url)}** to position {new_position}!"
+        )
+
+    @commands.command(name="skipto", help="Skips ahead to a queue position")
+    async def skip_to(self, ctx, position: int):
+        player = self.queued_player(ctx, position)
+        if player is None:
+            await ctx.send("There is no song at that position!")
+            return
+
+        player.skip_to(position - 1)
+        if ctx.voice_client and (
+            ctx.voice_client.is_playing() or ctx.voice_client.is_paused()
+        ):
+            ctx.voice_client.stop()
+        await ctx.send(f"⏭️ Skipped to position {position}!")
+
+    @commands.command(name="shuffle", help="Shuffles the queue")
+    async def shuffle(self, ctx):
+        player = self.players.find(ctx.guild.id)
+        if player is None or len(player.queue) < 2:
+            await ctx.send("Not enough songs in the queue to shuffle!")
+            return
+
+        player.shuffle()
+        await ctx.send(f"🔀 Shuffled {len(player.queue)} songs!")
+
     @commands.command(name="pause", help="Pauses the current song")
     async def pause(self, ctx):
-        if not self.bot.is_playing:
+        player = self.players.find(ctx.guild.id)
+        if player is None or not player.is_playing:
             await ctx.send("No song is currently playing!")
             return
 
@@ -461,7 +929,8 @@ class Music(commands.Cog):
 
     @commands.command(name="resume", help="Resumes the current song")
     async def resume(self, ctx):
-        if not self.bot.is_playing:
+        player = self.players.find(ctx.guild.id)
+        if player is None or not player.is_playing:
             await ctx.send("No song is paused!")
             return
 
@@ -473,27 +942,23 @@ class Music(commands.Cog):
         name="nowplaying", aliases=["np"], help="Shows the currently playing song"
     )
     async def now_playing(self, ctx):
-        if not self.bot.current_song:
+        player = self.players.find(ctx.guild.id)
+        if player is None or not player.current_song:
             await ctx.send("No song is currently playing!")
             return
 
+        current_song = player.current_song
         embed = discord.Embed(
             title="Now Playing",
-            description=f"[{self.bot.current_song.title}]({self.bot.current_song.url})",
+            description=f"[{current_song.title}]({player.current_url})",
             color=discord.Color.green(),
         )
-        if (
-            hasattr(self.bot.current_song, "thumbnail")
-            and self.bot.current_song.thumbnail
-        ):
-            embed.set_thumbnail(url=self.bot.current_song.thumbnail)
-        if (
-            hasattr(self.bot.current_song, "duration")
-            and self.bot.current_song.duration
-        ):
+        if hasattr(current_song, "thumbnail") and current_song.thumbnail:
+            embed.set_thumbnail(url=current_song.thumbnail)
+        if hasattr(current_song, "duration") and current_song.duration:
             embed.add_field(
                 name="Duration",
-                value=f"{self.bot.current_song.duration // 60}:{self.bot.current_song.duration % 60:02}",
+                value=f"{current_song.duration // 60}:{current_song.duration % 60:02}",
             )
         await ctx.send(embed=embed)
 
@@ -0,0 +1,231 @@
+import time
+import discord
+from discord.ext import commands
+
+from modules.audio.metrics import LoopMonitor, MetricsServer, metrics
+
+# Prometheus scrape endpoint; only reachable from this machine by default.
+# Worker processes from launcher.py listen on METRICS_PORT + their index.
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+
+# How often event loop lag is sampled, and how long the loop may be blocked
+# before the stack of whatever is blocking it gets printed
+LOOP_SAMPLE_INTERVAL = 0.5
+SLOW_CALLBACK_THRESHOLD = 0.25
+
+command_seconds = metrics.histogram(
+    "command_seconds", "Time from a command being invoked until it returned"
+)
+
+
+def format_seconds(seconds):
+    if seconds is None:
+        return "-"
+    if seconds == float("inf"):
+        return "slower than the largest bucket"
+    if seconds < 1:
+        return f"{seconds * 1000:.0f} ms"
+    return f"{seconds:g} s"
+
+
+def format_latency(histogram, **labels):
+    count = histogram.count(**labels)
+    p50 = format_seconds(histogram.quantile(0.5, **labels))
+    p95 = format_seconds(histogram.quantile(0.95, **labels))
+    return f"{count}× p50 ≤ {p50}, p95 ≤ {p95}"
+
+
+def ratio(part, whole):
+    return f"{part / whole:.0%}" if whole else "-"
+
+
+class Stats(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.monitor = LoopMonitor(LOOP_SAMPLE_INTERVAL, SLOW_CALLBACK_THRESHOLD)
+        worker = getattr(bot, "worker", None) or 0
+        self.server = MetricsServer(METRICS_HOST, METRICS_PORT + worker)
+        # Command timing has to start before the command runs, which a
+        # listener (scheduled as its own task) can't guarantee. Timing ends
+        # in the after-invoke hook rather than an on_command_error listener,
+        # whose mere presence silences discord.py's default error logging.
+        # The bot only has one hook of each kind, so whatever was there is
+        # still called, and put back on unload.
+        self._hooks = (bot._before_invoke, bot._after_invoke)
+        bot.before_invoke(self.start_timer)
+        bot.after_invoke(self.stop_timer)
+
+        self.gauges = {
+            "voice_clients": (
+                "Voice connections currently open",
+                lambda: len(self.bot.voice_clients),
+            ),
+            "guild_players": (
+                "Guilds with an active music player",
+                lambda: self.music_value(lambda music: len(music.players)),
+            ),
+            "ytdl_jobs_queued": (
+                "yt-dlp jobs waiting for a worker",
+                lambda: self.music_value(
+                    lambda music: music.extractor.stats()["queued"]
+                ),
+            ),
+            "ytdl_jobs_running": (
+                "yt-dlp jobs running right now",
+                lambda: self.music_value(lambda music: music.extractor.running),
+            ),
+            "transcode_jobs_queued": (
+                "Downloads waiting to be converted to Opus",
+                lambda: self.music_value(
+                    lambda music: music.transcoder.stats()["queued"]
+                ),
+            ),
+            "transcode_jobs_running": (
+                "FFmpeg conversions running right now",
+                lambda: self.music_value(lambda music: music.transcoder.running),
+            ),
+            "downloads_in_flight": (
+                "Tracks being downloaded right now",
+                lambda: self.music_value(lambda music: len(music.downloads)),
+            ),
+            "downloads_joined": (
+                "Download requests that joined one already in progress",
+                lambda: self.music_value(lambda music: music.downloads.joined),
+            ),
+            "ytdl_rate_limited": (
+                "1 while extraction is paused because YouTube rate limits us",
+                lambda: self.music_value(lambda music: int(music.breaker.is_open)),
+            ),
+            "failure_cache_hits": (
+                "Extractions skipped because the URL failed permanently before",
+                lambda: self.music_value(lambda music: music.failures.hits),
+            ),
+            "search_cache_hits": (
+                "Searches answered from the search cache",
+                lambda: self.music_value(lambda music: music.search_cache.hits),
+            ),
+            "search_cache_misses": (
+                "Searches that had to go to YouTube",
+                lambda: self.music_value(lambda music: music.search_cache.misses),
+            ),
+            "track_cache_bytes": (
+                "Bytes of audio in the track cache",
+                lambda: self.music_value(lambda music: music.cache.total),
+            ),
+        }
+        for name, (help, read) in self.gauges.items():
+            metrics.gauge(name, help, read)
+
+    def music_value(self, read):
+        music = self.bot.get_cog("Music")
+        return read(music) if music is not None else 0
+
+    async def cog_load(self):
+        self.monitor.start()
+        try:
+            await self.server.start()
+        except OSError as e:
+            print(f"Metrics endpoint not available: {e}")
+
+    async def cog_unload(self):
+        before, after = self._hooks
+        if self.bot._before_invoke == self.start_timer:
+            self.bot._before_invoke = before
+        if self.bot._after_invoke == self.stop_timer:
+            self.bot._after_invoke = after
+        self.monitor.stop()
+        await self.server.stop()
+        for name in self.gauges:
+            metrics.remove_gauge(name)
+
+    async def start_timer(self, ctx):
+        ctx.started_at = time.perf_counter()
+        if self._hooks[0] is not None:
+            await self._hooks[0](ctx)
+
+    async def stop_timer(self, ctx):
+        self.record(ctx, "error" if ctx.command_failed else "ok")
+        if self._hooks[1] is not None:
+            await self._hooks[1](ctx)
+
+    def record(self, ctx, status):
+        started_at = getattr(ctx, "started_at", None)
+        if started_at is None or ctx.command is None:
+            return
+        command_seconds.observe(
+            time.perf_counter() - started_at,
+            command=ctx.command.qualified_name,
+            status=status,
+        )
+
+    @commands.command(name="stats", help="Shows latency and cache statistics")
+    async def stats(self, ctx):
+        embed = discord.Embed(title="Bot Statistics", color=discord.Color.blue())
+
+        monitor = self.monitor
+        embed.add_field(
+            name="Event loop",
+            value=(
+                f"Lag now {format_seconds(monitor.last_lag)}, "
+                f"p95 ≤ {format_seconds(monitor.lag.quantile(0.95))}, "
+                f"max {format_seconds(monitor.max_lag)}\n"
+                f"Blocked > {format_seconds(monitor.threshold)}: "
+                f"{int(monitor.stalls.total())} times"
+            ),
+            inline=False,
+        )
+
+        lines = []
+        for labels in sorted(command_seconds.labels(), key=lambda l: l["command"]):
+            failed = " (failed)" if labels["status"] == "error" else ""
+            lines.append(
+                f"`{labels['command']}`{failed}: "
+                f"{format_latency(command_seconds, **labels)}"
+            )
+        embed.add_field(
+            name="Commands", value="\n".join(lines) or "None yet", inline=False
+        )
+
+        ytdl = metrics.get("ytdl_seconds")
+        downloads = metrics.get("download_seconds")
+        if ytdl is not None:
+            embed.add_field(
+                name="yt-dlp",
+                value=(
+                    f"Extract: {format_latency(ytdl, op='extract')}\n"
+                    f"Download: {format_latency(ytdl, op='download')}\n"
+                    f"Download + store: {format_latency(downloads)}"
+                ),
+                inline=False,
+            )
+
+        music = self.bot.get_cog("Music")
+        played = metrics.get("tracks_played_total")
+        if music is not None and played is not None:
+            search = music.search_cache
+            embed.add_field(
+                name="Cache",
+                value=(
+                    "Tracks played from cache: "
+                    f"{ratio(played.value(source='cache'), played.total())}\n"
+                    "Searches answered from cache: "
+                    f"{ratio(search.hits, search.hits + search.misses)}\n"
+                    f"Track cache size: {(music.cache.total) / 1024**3:.2f} GiB"
+                ),
+                inline=False,
+            )
+
+        embed.add_field(
+            name="Voice",
+            value=(
+                f"{len(self.bot.voice_clients)} voice clients, "
+                f"{self.music_value(lambda music: len(music.players))} players"
+            ),
+            inline=False,
+        )
+        await ctx.send(embed=embed)
+
+
+async def setup(bot):
+    await bot.add_cog(Stats(bot))